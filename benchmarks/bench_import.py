@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+# modules that should only be imported once a feature needing them is used
+heavy_modules = ("astropy", "h5py", "simfiles", "scipy")
+
+
+class TimeImport:
+    def timeraw_import_simtrees(self):
+        # run in a fresh interpreter each time by asv
+        return "import simtrees"
+
+
+class TrackImport:
+    def track_heavy_modules_imported(self):
+        # number of heavy_modules loaded by importing simtrees, should be 0
+        code = (
+            "import sys, simtrees; "
+            "print(sum(m.split('.')[0] in {0!r} for m in sys.modules))"
+        ).format(set(heavy_modules))
+        return int(subprocess.check_output([sys.executable, "-c", code]))
+
+    track_heavy_modules_imported.unit = "modules"
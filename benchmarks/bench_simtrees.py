@@ -0,0 +1,170 @@
+import os
+import numpy as np
+from simtrees import Tree, TreeTables, write_forest
+from simtrees import _kernels
+from simtrees._hdf5_io import hdf5_get
+
+# forest sizes (number of trees) and read parallelism to benchmark
+sizes = [1000, 10000, 50000]
+ncpus = [1, 4]
+# root masses (1e10 Msun/h) of the trees of the tree-building benchmarks,
+# giving trees of about 100 and 100000 nodes
+tree_masses = {"small": 0.1, "huge": 400.0}
+
+
+def _write_forest(directory, ntrees, **kwargs):
+    # synthetic forest in the directory asv runs setup_cache in; returns the
+    # paths of the data and of a configfile for it
+    directory = os.path.abspath(directory)
+    fbase, sfbase, nnodes = write_forest(
+        directory, ntrees, nparts=min(ntrees, 4), seed=0, **kwargs
+    )
+    configfile = os.path.join(directory, "config.py")
+    with open(configfile, "w") as f:
+        f.write(
+            "paths = {{'bench': ({0!r}, {1!r}, {2!r})}}\n".format(
+                directory, fbase, sfbase
+            )
+        )
+    return directory, sfbase, configfile
+
+
+def _write_trees():
+    # a forest with just the one tree for each case
+    return {
+        tree: _write_forest(tree, 1, mlow=mass, mmax=mass)[2]
+        for tree, mass in tree_masses.items()
+    }
+
+
+def _write_forests():
+    return {
+        nroots: _write_forest(os.path.join("forests", str(nroots)), nroots)
+        for nroots in sizes
+    }
+
+
+class TimeHdf5Get:
+    params = (sizes, ncpus, [False, True])
+    param_names = ["nroots", "ncpu", "interval"]
+    timeout = 600
+
+    def setup_cache(self):
+        return _write_forests()
+
+    def setup(self, forests, nroots, ncpu, interval):
+        self.path, self.sfbase, configfile = forests[nroots]
+        n = len(hdf5_get(self.path, self.sfbase, "/Subhalo/nodeIndex", ncpu=1))
+        # a window over the middle half of the table, spanning parts
+        self.interval = (n // 4, 3 * n // 4) if interval else None
+
+    def time_hdf5_get(self, forests, nroots, ncpu, interval):
+        hdf5_get(
+            self.path,
+            self.sfbase,
+            "/Subhalo/MassType",
+            ncpu=ncpu,
+            interval=self.interval,
+        )
+
+
+class TimeTreeTables:
+    params = (sizes, ncpus)
+    param_names = ["nroots", "ncpu"]
+    timeout = 600
+
+    def setup_cache(self):
+        return _write_forests()
+
+    def setup(self, forests, nroots, ncpu):
+        self.configfile = forests[nroots][2]
+        self.treetables = TreeTables(
+            "bench", self.configfile, ncpu=ncpu, instrument=False
+        )
+
+    def time_init(self, forests, nroots, ncpu):
+        TreeTables("bench", self.configfile, ncpu=ncpu, instrument=False)
+
+    def peakmem_init(self, forests, nroots, ncpu):
+        TreeTables("bench", self.configfile, ncpu=ncpu, instrument=False)
+
+    def time_mass_filter(self, forests, nroots, ncpu):
+        self.treetables.mass_filter(1e9)
+        self.treetables.reset_filter()
+
+    def time_reverse(self, forests, nroots, ncpu):
+        self.treetables._index = dict()
+        self.treetables._reverse()
+
+
+class TimeTree:
+    params = ["small", "huge"]
+    param_names = ["tree"]
+    timeout = 600
+
+    def setup_cache(self):
+        return _write_trees()
+
+    def setup(self, configfiles, tree):
+        self.treetables = TreeTables(
+            "bench", configfiles[tree], ncpu=1, instrument=False
+        )
+        # the root is at the last of 64 snapshots
+        self.group = (63, 0, 0)
+        # build the indices used when growing trees outside the timings
+        self.tree = Tree(self.group, treetables=self.treetables)
+
+    def time_tree(self, configfiles, tree):
+        Tree(self.group, treetables=self.treetables)
+
+    def time_make_trunk(self, configfiles, tree):
+        self.tree._make_trunk()
+
+    def track_nodes(self, configfiles, tree):
+        return len(self.tree.nodes)
+
+    track_nodes.unit = "nodes"
+
+
+class TimeKernels:
+    # index-based walks over the same trees as TimeTree, with each kernel
+    # backend; compare time_subtree with TimeTree.time_tree
+    params = (["small", "huge"], ["numpy", "numba"])
+    param_names = ["tree", "backend"]
+    timeout = 600
+
+    def setup_cache(self):
+        return _write_trees()
+
+    def setup(self, configfiles, tree, backend):
+        if backend == "numba":
+            try:
+                import numba  # noqa: F401
+            except ImportError:
+                raise NotImplementedError("numba is not installed")
+        _kernels.backend = backend
+        self.treetables = TreeTables(
+            "bench", configfiles[tree], ncpu=1, instrument=False
+        )
+        self.key = self.treetables.sub_groups_r[(63, 0, 0)]
+        self.keys = np.asarray(self.treetables._columns["ids"])
+        # build the indices and compile the kernels outside the timings
+        self.treetables.subtree(self.key)
+        self.treetables.subtree_size([self.key])
+        self.treetables.depth([self.key])
+        self.treetables.history([self.key], "sns")
+
+    def teardown(self, configfiles, tree, backend):
+        _kernels.backend = None
+
+    def time_subtree(self, configfiles, tree, backend):
+        self.treetables.subtree(self.key)
+
+    def time_subtree_size(self, configfiles, tree, backend):
+        self.treetables.subtree_size(self.keys)
+
+    def time_depth(self, configfiles, tree, backend):
+        self.treetables.depth(self.keys)
+
+    def time_main_branches(self, configfiles, tree, backend):
+        self.treetables._branches(self.keys)
@@ -11,5 +11,8 @@ setup(
     packages=["simtrees"],
     install_requires=["numpy", "h5py"],
     include_package_data=True,
+    entry_points={
+        "console_scripts": ["simtrees-generate=simtrees._generate:main"]
+    },
     zip_safe=False,
 )
@@ -1 +1,3 @@
 from ._simtrees import Tree, TreeTables
+from ._join import join_ids
+from ._generate import write_forest
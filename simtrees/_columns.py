@@ -0,0 +1,209 @@
+import numpy as np
+from collections.abc import Mapping, ItemsView, ValuesView
+
+# rows handled at a time when iterating over a view
+_chunk_rows = 65536
+
+
+class _ColumnMap(Mapping):
+    # read-only dict-like view of one or more columns, keyed by node index
+    # ids must be sorted; rows (optional) restricts the view to a subset of
+    # rows, in which case keys must be ids[rows]; alternatively, visible
+    # (optional) flags the rows included in the view
+
+    def __init__(
+        self, ids, columns, rows=None, keys=None, unit=None, visible=None
+    ):
+        self._keys = ids if rows is None else keys
+        self._columns = columns
+        self._rows = rows
+        self._unit = unit
+        self._visible = visible
+        return
+
+    def _row(self, key):
+        i = self._keys.searchsorted(key)
+        if (i == len(self._keys)) or (self._keys[i] != key):
+            raise KeyError(key)
+        row = i if self._rows is None else self._rows[i]
+        if self._visible is not None and not self._visible[row]:
+            raise KeyError(key)
+        return row
+
+    def __getitem__(self, key):
+        row = self._row(key)
+        if len(self._columns) == 1:
+            value = self._columns[0][row]
+        else:
+            value = np.array([column[row] for column in self._columns])
+        return value if self._unit is None else value * self._unit
+
+    def __contains__(self, key):
+        try:
+            self._row(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for keys, values in self._chunks(with_values=False):
+            yield from keys
+        return
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    def _chunks(self, with_values=True):
+        # (keys, values) of the view a chunk of rows at a time, values as
+        # __getitem__ gives them, rather than looking keys up one by one
+        for start in range(0, len(self._keys), _chunk_rows):
+            stop = min(start + _chunk_rows, len(self._keys))
+            keys = np.asarray(self._keys[start:stop])
+            if self._rows is None:
+                rows = slice(start, stop)
+            else:
+                rows = self._rows[start:stop]
+            values = self._take(rows) if with_values else None
+            if self._visible is not None:
+                visible = np.asarray(self._visible[rows])
+                keys = keys[visible]
+                values = None if values is None else values[visible]
+            yield keys, values
+        return
+
+    def _take(self, rows):
+        if len(self._columns) == 1:
+            values = np.asarray(self._columns[0][rows])
+        else:
+            values = np.stack(
+                [np.asarray(column[rows]) for column in self._columns],
+                axis=1,
+            )
+        return values if self._unit is None else values * self._unit
+
+    def __len__(self):
+        if self._visible is None:
+            return len(self._keys)
+        return _count(self._visible)
+
+
+class _GroupMap(Mapping):
+    # read-only dict-like view from (snapshot, fof, subgroup) tuples to node
+    # index; groups is a structured array sorted lexicographically, rows
+    # gives the row of each group in the columns; visible (optional) flags
+    # the rows included in the view
+
+    def __init__(self, ids, groups, rows, visible=None):
+        self._ids = ids
+        self._groups = groups
+        self._rows = rows
+        self._visible = visible
+        return
+
+    def __getitem__(self, group):
+        group = np.array(tuple(group), dtype=self._groups.dtype)
+        # as for a dict built from the rows in order, the last row wins
+        i = self._groups.searchsorted(group, side="right") - 1
+        if (i < 0) or (self._groups[i] != group):
+            raise KeyError(tuple(group.tolist()))
+        row = self._rows[i]
+        if self._visible is not None and not self._visible[row]:
+            raise KeyError(tuple(group.tolist()))
+        return self._ids[row]
+
+    def __contains__(self, group):
+        try:
+            self[group]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for groups, ids in self._chunks(with_values=False):
+            yield from groups
+        return
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    def _chunks(self, with_values=True):
+        # (groups, node indices) of the view a chunk of rows at a time,
+        # groups as tuples
+        for start in range(0, len(self._groups), _chunk_rows):
+            stop = min(start + _chunk_rows, len(self._groups))
+            groups = np.asarray(self._groups[start:stop])
+            rows = np.asarray(self._rows[start:stop])
+            if self._visible is not None:
+                visible = np.asarray(self._visible[rows])
+                groups, rows = groups[visible], rows[visible]
+            ids = np.asarray(self._ids[rows]) if with_values else None
+            yield [tuple(group) for group in groups.tolist()], ids
+        return
+
+    def __len__(self):
+        if self._visible is None:
+            return len(self._groups)
+        return sum(
+            int(np.count_nonzero(self._visible[rows]))
+            for start, rows in _pieces(self._rows)
+        )
+
+
+class _ItemsView(ItemsView):
+    # items of a _ColumnMap or _GroupMap, read a chunk of rows at a time
+
+    def __iter__(self):
+        for keys, values in self._mapping._chunks():
+            yield from zip(keys, values)
+        return
+
+
+class _ValuesView(ValuesView):
+    # values of a _ColumnMap or _GroupMap, read a chunk of rows at a time
+
+    def __iter__(self):
+        for keys, values in self._mapping._chunks():
+            yield from values
+        return
+
+
+def _match(column, predicate):
+    # mask of column values matching predicate: a (min, max) tuple selects
+    # min <= value < max (either may be None), a list or array selects
+    # values in it, anything else selects values equal to it
+    if isinstance(predicate, tuple):
+        lo, hi = predicate
+        mask = np.ones(len(column), dtype=bool)
+        if lo is not None:
+            mask &= column >= lo
+        if hi is not None:
+            mask &= column < hi
+        return mask
+    elif np.ndim(predicate) > 0:
+        return np.isin(column, predicate)
+    else:
+        return column == predicate
+
+
+def _padding(dtype):
+    # fill value for rows without an entry, and the dtype to hold it
+    fill = -1 if dtype.kind in "iu" else np.nan
+    return fill, np.result_type(dtype, np.min_scalar_type(fill))
+
+
+def _pieces(column):
+    # (start, values) pieces of an array, or the blocks of a column kept on
+    # disk
+    if hasattr(column, "blocks"):
+        return column.blocks()
+    return iter([(0, column)])
+
+
+def _count(flags):
+    return sum(int(np.count_nonzero(piece)) for start, piece in _pieces(flags))
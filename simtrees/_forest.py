@@ -0,0 +1,86 @@
+import numpy as np
+import heapq
+
+
+def _descendant_rows(ids, descids, rows=None):
+    # row of the descendant of each row (-1 if none or not among rows); ids
+    # must be sorted, rows (optional) restricts the forest to a subset
+    desc_rows = np.full(len(ids), -1, dtype=np.int64)
+    if rows is None:
+        rows = np.arange(len(ids))
+    keys = ids[rows]
+    pos = np.searchsorted(keys, descids[rows])
+    pos[pos == len(keys)] = 0
+    found = np.logical_and(
+        keys[pos] == descids[rows], descids[rows] != keys
+    )
+    desc_rows[rows[found]] = rows[pos[found]]
+    return desc_rows
+
+
+def _balance(weights, nbins):
+    # assign items to nbins bins with near-equal total weights, heaviest
+    # first, each to the currently lightest bin
+    bins = [[] for i in range(nbins)]
+    loads = [(0, b) for b in range(nbins)]
+    for i in np.argsort(weights, kind="stable")[::-1]:
+        load, b = heapq.heappop(loads)
+        bins[b].append(i)
+        heapq.heappush(loads, (load + weights[i], b))
+    return [sorted(b) for b in bins if len(b) > 0]
+
+
+def _main_progenitor_rows(ids, prog_descids, prog_rows):
+    # row of the main progenitor (most mbpc contributed) of each row, or -1;
+    # prog_descids and prog_rows sorted by descendant, then increasing mbpc
+    main_rows = np.full(len(ids), -1, dtype=np.int64)
+    # a node is not its own progenitor
+    keep = ids[prog_rows] != prog_descids
+    descids, rows = prog_descids[keep], prog_rows[keep]
+    if len(descids) == 0:
+        return main_rows
+    last = np.flatnonzero(np.append(descids[1:] != descids[:-1], True))
+    desc_rows = np.searchsorted(ids, descids[last])
+    desc_rows[desc_rows == len(ids)] = 0
+    found = ids[desc_rows] == descids[last]
+    main_rows[desc_rows[found]] = rows[last][found]
+    return main_rows
+
+
+def _mergers(ids, prog_descids, prog_rows):
+    # (descendant, main progenitor, other progenitor) rows of every merger,
+    # with prog_descids and prog_rows as for _main_progenitor_rows
+    keep = ids[prog_rows] != prog_descids
+    descids, rows = prog_descids[keep], prog_rows[keep]
+    if len(descids) == 0:
+        return tuple(np.empty(0, dtype=np.int64) for i in range(3))
+    last = np.append(descids[1:] != descids[:-1], True)
+    runs = np.cumsum(np.append(True, last[:-1])) - 1
+    main_rows = rows[last][runs]
+    desc_rows = np.searchsorted(ids, descids)
+    desc_rows[desc_rows == len(ids)] = 0
+    merged = ~last & (ids[desc_rows] == descids)
+    return desc_rows[merged], main_rows[merged], rows[merged]
+
+
+def _jump(pointers):
+    # follow pointers from row to row to where they end (rows pointing to
+    # themselves), doubling the distance covered at each pass
+    while True:
+        jumped = pointers[pointers]
+        if np.array_equal(jumped, pointers):
+            return pointers
+        pointers = jumped
+
+
+def _children(ids, prog_descids, prog_rows):
+    # (offsets, rows) listing the progenitors of row r, by increasing mbpc,
+    # as rows[offsets[r]: offsets[r + 1]]; prog_descids and prog_rows as
+    # for _main_progenitor_rows
+    desc_rows = np.searchsorted(ids, prog_descids)
+    desc_rows[desc_rows == len(ids)] = 0
+    found = np.logical_and(
+        ids[desc_rows] == prog_descids, desc_rows != prog_rows
+    )
+    offsets = np.searchsorted(desc_rows[found], np.arange(len(ids) + 1))
+    return offsets, prog_rows[found]
@@ -0,0 +1,66 @@
+import numpy as np
+
+# columns of the tables made by to_pandas() and to_arrow(): name, TreeTables
+# column, and labels for the components of multidimensional columns
+_table_columns = (
+    ("key", "ids", None),
+    ("descendant", "descids", None),
+    ("snapshot", "sns", None),
+    ("fof", "gns", None),
+    ("sgn", "sgns", None),
+    ("cop", "cops", ("x", "y", "z")),
+    ("vel", "vels", ("x", "y", "z")),
+    ("masstypes", "masstypes", ("0", "1", "2", "3", "4", "5")),
+)
+
+
+def _to_pandas(table):
+    # DataFrame of (name, values, unit, components) columns, a column per
+    # component; pandas is given the arrays as they are, to avoid copies
+    import pandas as pd
+
+    columns = dict()
+    units = dict()
+    for name, values, unit, components in table:
+        if components is None:
+            columns[name] = values
+            labels = (name,)
+        else:
+            labels = tuple(
+                "{0:s}_{1:s}".format(name, component)
+                for component in components
+            )
+            for i, label in enumerate(labels):
+                columns[label] = values[:, i]
+        if unit is not None:
+            units.update({label: unit for label in labels})
+    frame = pd.DataFrame(columns, copy=False)
+    frame.attrs["units"] = units
+    return frame
+
+
+def _to_arrow(table):
+    # Table of (name, values, unit, components) columns, multidimensional
+    # columns as fixed-size lists over the flattened values; arrow wraps
+    # contiguous numeric arrays without copying
+    import pyarrow as pa
+
+    arrays = []
+    fields = []
+    for name, values, unit, components in table:
+        if components is None:
+            array = pa.array(values)
+        else:
+            array = pa.FixedSizeListArray.from_arrays(
+                pa.array(np.ascontiguousarray(values).reshape(-1)),
+                len(components),
+            )
+        arrays.append(array)
+        fields.append(
+            pa.field(
+                name,
+                array.type,
+                metadata=None if unit is None else {"unit": unit},
+            )
+        )
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
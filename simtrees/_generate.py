@@ -0,0 +1,349 @@
+import numpy as np
+import os
+import argparse
+
+# node indices are snapshot * _id_stride + a running count at the snapshot
+_id_stride = 1000000000000
+
+
+def _power_law(rng, lo, hi, slope):
+    # samples from p(x) ~ x**slope between lo and hi (arrays or scalars)
+    a = slope + 1
+    u = rng.random(np.broadcast(lo, hi).shape)
+    return (lo**a + u * (hi**a - lo**a)) ** (1 / a)
+
+
+def _progenitors(rng, level, mmin, merged, accretion, boxsize):
+    # one snapshot back from the nodes in level: a main progenitor losing
+    # the mass accreted and merged in, plus resolved secondary progenitors
+    # with mass ratios from mmin / mass up to 1 / 2, distributed as
+    # ratio**-2 (mostly minor mergers)
+    mass = level["mass"]
+    lo = np.minimum(mmin / mass, 0.5)
+    mean_ratio = np.ones(len(mass))
+    minor = lo < 0.5
+    mean_ratio[minor] = np.log(0.5 / lo[minor]) / (1 / lo[minor] - 2)
+    counts = rng.poisson(np.where(minor, merged / mean_ratio, 0))
+    desc = np.repeat(np.arange(len(mass)), counts)
+    ratios = _power_law(rng, lo[desc], 0.5, -2)
+    secondary = ratios * mass[desc]
+    main = mass * (1 - rng.uniform(0, 2 * accretion, len(mass)))
+    main -= np.bincount(desc, weights=secondary, minlength=len(mass))
+    resolved = main >= mmin
+    desc = np.concatenate((np.flatnonzero(resolved), desc))
+    progs = {
+        "mass": np.concatenate((main[resolved], secondary)),
+        "desc": desc,
+        "main": np.arange(len(desc)) < np.sum(resolved),
+    }
+    spread = np.where(progs["main"], 0.05, 0.5)[:, np.newaxis]
+    progs["pos"] = np.mod(
+        level["pos"][desc] + rng.normal(size=(len(desc), 3)) * spread,
+        boxsize,
+    )
+    progs["vel"] = level["vel"][desc] + rng.normal(
+        scale=100, size=(len(desc), 3)
+    ) * np.sqrt(spread / 0.5)
+    progs["tree"] = level["tree"][desc]
+    return progs
+
+
+def _grow(rng, roots, nsnap, mmin, merged, accretion, boxsize):
+    # all the nodes of the trees with the given root masses, level by level
+    # from the last snapshot; each node has the row of its descendant
+    level = {
+        "mass": roots,
+        "desc": np.full(len(roots), -1),
+        "main": np.ones(len(roots), dtype=bool),
+        "pos": rng.random((len(roots), 3)) * boxsize,
+        "vel": rng.normal(scale=200, size=(len(roots), 3)),
+        "tree": np.arange(len(roots)),
+    }
+    levels = [level]
+    sns = [np.full(len(roots), nsnap - 1)]
+    offset = 0
+    for sn in range(nsnap - 2, -1, -1):
+        level = _progenitors(rng, level, mmin, merged, accretion, boxsize)
+        if len(level["mass"]) == 0:
+            break
+        level["desc"] = level["desc"] + offset
+        offset += len(levels[-1]["mass"])
+        levels.append(level)
+        sns.append(np.full(len(level["mass"]), sn))
+    nodes = {
+        name: np.concatenate([level[name] for level in levels])
+        for name in levels[0]
+    }
+    nodes["sns"] = np.concatenate(sns)
+    return nodes
+
+
+def _append(f, name, values):
+    # append to a (resizable) dataset, creating it if needed
+    if name not in f:
+        f.create_dataset(
+            name,
+            data=values,
+            maxshape=(None,) + values.shape[1:],
+            chunks=True,
+        )
+    else:
+        dataset = f[name]
+        n = dataset.shape[0]
+        dataset.resize(n + len(values), axis=0)
+        dataset[n:] = values
+    return
+
+
+def _number(counts, sns, select=None):
+    # number the (selected) nodes within their snapshots, carrying on from
+    # the counts at each snapshot so far, which are updated
+    select = np.ones(len(sns), dtype=bool) if select is None else select
+    index = np.full(len(sns), -1, dtype=np.int64)
+    rows = np.flatnonzero(select)
+    rows = rows[np.argsort(sns[rows], kind="stable")]
+    starts = np.searchsorted(sns[rows], sns[rows])
+    index[rows] = np.arange(len(rows)) - starts + counts[sns[rows]]
+    np.add.at(counts, sns[rows], 1)
+    return index
+
+
+def _write_batch(ftree, fsub, rng, nodes, counters, phantom, interpolated):
+    n = len(nodes["mass"])
+    sns = nodes["sns"]
+    is_interpolated = rng.random(n) < interpolated
+    is_interpolated[nodes["desc"] < 0] = False
+    ids = sns * _id_stride + _number(counters["nodes"], sns)
+    ids[is_interpolated] += phantom
+    descids = np.where(nodes["desc"] >= 0, ids[nodes["desc"]], -1)
+    tabposs = _number(counters["catalogue"], sns, ~is_interpolated)
+    # one fof group per tree and snapshot, subgroups by decreasing mass
+    order = np.lexsort((-nodes["mass"], nodes["tree"], sns))
+    first = np.ones(n, dtype=bool)
+    first[1:] = np.logical_or(
+        np.diff(sns[order]) != 0, np.diff(nodes["tree"][order]) != 0
+    )
+    groups = np.zeros(n, dtype=np.int64)
+    groups[order[first]] = _number(counters["groups"], sns[order[first]])
+    starts = np.flatnonzero(first)
+    lengths = np.diff(np.append(starts, n))
+    groups[order] = np.repeat(groups[order[first]], lengths)
+    sgns = np.empty(n, dtype=np.int32)
+    sgns[order] = np.arange(n) - np.repeat(starts, lengths)
+    # most bound particles contributed, roughly in proportion to mass
+    mbpcs = np.maximum(
+        nodes["mass"] * 2000 * rng.lognormal(0, 0.2, n), 1
+    ).astype(np.int64)
+
+    _append(ftree, "/haloTrees/nodeIndex", ids)
+    _append(ftree, "/haloTrees/snapshotNumber", sns.astype(np.int32))
+    _append(ftree, "/haloTrees/fofIndex", groups)
+    _append(ftree, "/haloTrees/descendantIndex", descids)
+    _append(ftree, "/haloTrees/mbpsContributed", mbpcs)
+    _append(
+        ftree, "/haloTrees/isInterpolated", is_interpolated.astype(np.int32)
+    )
+    _append(ftree, "/haloTrees/positionInCatalogue", tabposs)
+
+    rows = np.flatnonzero(~is_interpolated)
+    mass = nodes["mass"][rows]
+    masstypes = np.zeros((len(rows), 6), dtype=np.float32)
+    masstypes[:, 0] = 0.16 * mass * rng.uniform(0.3, 1, len(rows))
+    masstypes[:, 1] = 0.84 * mass
+    masstypes[:, 4] = 0.02 * mass * rng.uniform(0, 1, len(rows))
+    masstypes[:, 5] = 1e-5 * mass * rng.uniform(0, 1, len(rows))
+    _append(fsub, "/Subhalo/nodeIndex", ids[rows])
+    _append(fsub, "/Subhalo/SubGroupNumber", sgns[rows])
+    _append(
+        fsub,
+        "/Subhalo/CentreOfPotential",
+        nodes["pos"][rows].astype(np.float32),
+    )
+    _append(fsub, "/Subhalo/Velocity", nodes["vel"][rows].astype(np.float32))
+    _append(fsub, "/Subhalo/MassType", masstypes)
+    return n
+
+
+def write_forest(
+    directory,
+    ntrees,
+    nsnap=64,
+    nparts=16,
+    seed=None,
+    boxsize=100.0,
+    mmin=0.01,
+    mmax=10000.0,
+    mlow=None,
+    merged=0.02,
+    accretion=0.02,
+    interpolated=0.02,
+    phantom=10000000000000000,
+    batch=10000,
+):
+    """
+    Write a synthetic forest of merger trees in John Helly's format.
+
+    Root masses follow a power law mass function (dN/dM ~ M^-1.9). Going
+    back a snapshot, each halo's main progenitor loses the mass accreted
+    smoothly since then and the mass of the secondary progenitors merging
+    in, which range down to the resolution limit mmin (so that massive
+    halos have many more of them). Progenitors below mmin are dropped,
+    so trees of massive halos are larger and deeper. A fraction of the
+    nodes are interpolated (phantom) nodes without subfind entries.
+
+    Files tree_NNN.X.hdf5 and subfind_NNN.X.hdf5 are written, NNN being
+    the last snapshot, each part holding whole trees. Trees are generated
+    and written in batches, so memory use does not grow with the forest.
+
+    Parameters
+    ----------
+    directory: str
+        Output directory, created if needed.
+
+    ntrees: int
+        Number of trees.
+
+    nsnap: int
+        Number of snapshots.
+
+    nparts: int
+        Number of part files of each kind.
+
+    seed: int
+        Random seed (optional).
+
+    boxsize: float
+        Box side length in Mpc/h.
+
+    mmin: float
+        Resolution limit, in 1e10 Msun/h.
+
+    mmax: float
+        Largest root mass, in 1e10 Msun/h.
+
+    mlow: float
+        Smallest root mass, in 1e10 Msun/h (default: mmin).
+
+    merged: float
+        Mean fraction of a halo's mass brought in by resolved mergers per
+        snapshot.
+
+    accretion: float
+        Mean fraction of a halo's mass accreted smoothly per snapshot.
+
+    interpolated: float
+        Fraction of (non-root) nodes that are interpolated.
+
+    phantom: int
+        Offset of the node indices of interpolated nodes.
+
+    batch: int
+        Number of trees generated at a time.
+
+    Returns
+    -------
+    out : tuple
+        Base names of the tree and subfind files (see the configfile of
+        TreeTables), and the number of nodes written.
+    """
+
+    import h5py
+
+    mlow = mmin if mlow is None else mlow
+    fbase = "tree_{0:03d}".format(nsnap - 1)
+    sfbase = "subfind_{0:03d}".format(nsnap - 1)
+    os.makedirs(directory, exist_ok=True)
+    # running counts at each snapshot, so that indices are unique across
+    # batches and parts
+    counters = {
+        name: np.zeros(nsnap, dtype=np.int64)
+        for name in ("nodes", "catalogue", "groups")
+    }
+    nnodes = 0
+    for part, rng in enumerate(
+        np.random.default_rng(s)
+        for s in np.random.SeedSequence(seed).spawn(nparts)
+    ):
+        ftree = h5py.File(
+            os.path.join(directory, "{0:s}.{1:d}.hdf5".format(fbase, part)),
+            "w",
+        )
+        fsub = h5py.File(
+            os.path.join(directory, "{0:s}.{1:d}.hdf5".format(sfbase, part)),
+            "w",
+        )
+        with ftree, fsub:
+            remaining = ntrees // nparts + (part < ntrees % nparts)
+            while remaining > 0:
+                n = min(batch, remaining)
+                remaining -= n
+                roots = _power_law(rng, np.full(n, mlow), mmax, -1.9)
+                nodes = _grow(
+                    rng, roots, nsnap, mmin, merged, accretion, boxsize
+                )
+                nnodes += _write_batch(
+                    ftree, fsub, rng, nodes, counters, phantom, interpolated
+                )
+    return fbase, sfbase, nnodes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic forest of merger trees in John "
+        "Helly's format."
+    )
+    parser.add_argument("directory", help="output directory")
+    parser.add_argument("ntrees", type=int, help="number of trees")
+    parser.add_argument("--nsnap", type=int, default=64)
+    parser.add_argument("--nparts", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--boxsize", type=float, default=100.0)
+    parser.add_argument("--mmin", type=float, default=0.01)
+    parser.add_argument("--mmax", type=float, default=10000.0)
+    parser.add_argument("--mlow", type=float, default=None)
+    parser.add_argument("--merged", type=float, default=0.02)
+    parser.add_argument("--accretion", type=float, default=0.02)
+    parser.add_argument("--interpolated", type=float, default=0.02)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument(
+        "--config",
+        default=None,
+        help="also write a TreeTables configfile here, with the last "
+        "snapshot number as key",
+    )
+    args = parser.parse_args(argv)
+    fbase, sfbase, nnodes = write_forest(
+        args.directory,
+        args.ntrees,
+        nsnap=args.nsnap,
+        nparts=args.nparts,
+        seed=args.seed,
+        boxsize=args.boxsize,
+        mmin=args.mmin,
+        mmax=args.mmax,
+        mlow=args.mlow,
+        merged=args.merged,
+        accretion=args.accretion,
+        interpolated=args.interpolated,
+        batch=args.batch,
+    )
+    if args.config is not None:
+        with open(args.config, "w") as f:
+            f.write(
+                "paths = {{{0:d}: ({1!r}, {2!r}, {3!r})}}\n".format(
+                    args.nsnap - 1,
+                    os.path.abspath(args.directory),
+                    fbase,
+                    sfbase,
+                )
+            )
+    print(
+        "Wrote {0:d} nodes in {1:d} trees to {2:s}.".format(
+            nnodes, args.ntrees, args.directory
+        )
+    )
+    return
+
+
+if __name__ == "__main__":
+    main()
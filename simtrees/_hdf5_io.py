@@ -1,4 +1,3 @@
-import h5py as h5py
 import numpy as np
 import multiprocessing
 import os.path
@@ -14,6 +13,7 @@ class _hdf5_io():
         self._interval = interval
 
     def _subitem_interval(self, name, parts, output, intervals):
+        import h5py
         accumulator = []
         for part, interval in zip(parts, intervals):
             with h5py.File(part, 'r') as f:
@@ -22,6 +22,7 @@ class _hdf5_io():
         return
 
     def __getitem__(self, name):
+        import h5py
         items = []
         all_interval_parts = self._split_interval(name)
         all_parts = [p for p, i in zip(self._parts, all_interval_parts)
@@ -69,6 +70,7 @@ class _hdf5_io():
             return np.concatenate(items)
 
     def _split_interval(self, name):
+        import h5py
         slices = []
         start = 0
         for part in self._parts:
@@ -165,6 +167,8 @@ def hdf5_get(path, fbase, hpath, attr=None, ncpu=0, interval=None):
         Contents of requested dataset or attribute.
     """
 
+    import h5py
+
     if not attr:
         hdf5_file = _hdf5_io(path, fbase, ncpu=ncpu, interval=interval)
         retval = hdf5_file[hpath]
@@ -180,3 +184,77 @@ def hdf5_get(path, fbase, hpath, attr=None, ncpu=0, interval=None):
                        "attribute '{:s}' doesn't exist in file with path "
                        "'{:s}' and basename '{:s}')"
                        .format(hpath, attr, path, fbase))
+
+
+def hdf5_sizes(path, fbase, hpath):
+    """
+    Find the length of a dataset in each file of an hdf5 fileset.
+
+    Parameters
+    ----------
+    path: str
+        Directory containing hdf5 file(s).
+
+    fbase: str
+        Filename, omit '.X.hdf5' portion.
+
+    hpath: str
+        'Internal' path of data table, e.g. '/PartType1/ParticleIDs'
+
+    Returns
+    -------
+    out : list
+        Length of the dataset in each file, in order (0 where absent).
+    """
+
+    hdf5_file = _hdf5_io(path, fbase, ncpu=1)
+    return [
+        0 if part is False else part[1]
+        for part in hdf5_file._split_interval(hpath)
+    ]
+
+
+def hdf5_chunks(path, fbase, hpaths, chunk_rows=None):
+    """
+    Read datasets of an hdf5 fileset a chunk of rows at a time.
+
+    Each file is opened once, and the datasets (of equal lengths) are read
+    over the same rows.
+
+    Parameters
+    ----------
+    path: str
+        Directory containing hdf5 file(s).
+
+    fbase: str
+        Filename, omit '.X.hdf5' portion.
+
+    hpaths: tuple
+        'Internal' paths of data tables, e.g. ('/PartType1/ParticleIDs',).
+
+    chunk_rows: int
+        Most rows in a chunk (default: a chunk per file).
+
+    Returns
+    -------
+    out : generator
+        Yields (part, start, values): the index of the file, the index of
+        the first row of the chunk in the fileset, and a tuple of arrays
+        with the chunk of each dataset. Files without the datasets are
+        skipped.
+    """
+
+    import h5py
+
+    start = 0
+    for part, fname in enumerate(_hdf5_io(path, fbase, ncpu=1).get_parts()):
+        with h5py.File(fname, 'r') as f:
+            if hpaths[0] not in f:
+                continue
+            datasets = [f[hpath] for hpath in hpaths]
+            nrows = datasets[0].shape[0]
+            step = nrows if chunk_rows is None else chunk_rows
+            for lo in range(0, nrows, max(step, 1)):
+                hi = min(lo + step, nrows)
+                yield part, start + lo, tuple(d[lo: hi] for d in datasets)
+            start += nrows
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def join_ids(left, right, duplicates="raise"):
+    """
+    Match the entries of two arrays of ids (e.g. node indices).
+
+    Sorts the right array once and looks up every entry of the left array in
+    it with a binary search; neither array needs to be sorted. Ids present in
+    only one of the arrays are left out of the result.
+
+    Parameters
+    ----------
+    left: array_like
+        Ids to look up.
+
+    right: array_like
+        Ids to look them up in.
+
+    duplicates: str
+        What to do when an id occurs more than once in right: 'raise' a
+        ValueError, keep the 'first' or the 'last' occurrence, or keep
+        'all' of them (one output pair for each). Duplicates in left are
+        always matched independently.
+
+    Returns
+    -------
+    left_index, right_index : ndarray
+        Index arrays such that left[left_index] == right[right_index], in
+        order of increasing left_index.
+    """
+
+    left = np.asarray(left)
+    right = np.asarray(right)
+    order = np.argsort(right, kind="stable")
+    sorted_right = right[order]
+    lo = np.searchsorted(sorted_right, left, side="left")
+    hi = np.searchsorted(sorted_right, left, side="right")
+    counts = hi - lo
+    if duplicates == "raise":
+        if np.any(counts > 1):
+            raise ValueError(
+                "join_ids: {0:.0f} ids occur more than once in right.".format(
+                    np.unique(left[counts > 1]).size
+                )
+            )
+    elif duplicates == "first":
+        counts = np.minimum(counts, 1)
+    elif duplicates == "last":
+        lo = hi - 1
+        counts = np.minimum(counts, 1)
+    elif duplicates != "all":
+        raise ValueError(
+            "join_ids: duplicates must be one of 'raise', 'first', 'last' or "
+            "'all'."
+        )
+    left_index = np.repeat(np.arange(len(left)), counts)
+    # position of each output pair within its run of equal ids in right
+    offsets = np.arange(len(left_index)) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    right_index = order[np.repeat(lo, counts) + offsets]
+    return left_index, right_index
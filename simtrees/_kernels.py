@@ -0,0 +1,166 @@
+import numpy as np
+from functools import lru_cache
+from ._util import logger
+
+# Index-based tree walks over rows of the TreeTables columns. Each kernel
+# comes in a vectorized NumPy version and a plain-loop version, compiled
+# with numba when it is installed (uncompiled the loops are far too slow to
+# use). Rows are int64 arrays; -1 marks a missing row.
+
+# "numba", "numpy", or None for numba when it is installed
+backend = None
+
+
+def _gather_numpy(offsets, children, rows):
+    counts = offsets[rows + 1] - offsets[rows]
+    ends = np.repeat(offsets[rows + 1] - 1, counts)
+    within = np.arange(np.sum(counts)) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    return children[ends - within]
+
+
+def _gather_loops(offsets, children, rows):
+    total = 0
+    for r in rows:
+        total += offsets[r + 1] - offsets[r]
+    out = np.empty(total, dtype=np.int64)
+    k = 0
+    for r in rows:
+        for j in range(offsets[r + 1] - 1, offsets[r] - 1, -1):
+            out[k] = children[j]
+            k += 1
+    return out
+
+
+def _main_branches_numpy(rows, main_rows):
+    branches = [rows]
+    while True:
+        rows = branches[-1]
+        rows = np.where(rows >= 0, main_rows[np.maximum(rows, 0)], -1)
+        if not np.any(rows >= 0):
+            break
+        branches.append(rows)
+    return np.stack(branches, axis=1)
+
+
+def _main_branches_loops(rows, main_rows):
+    lengths = np.zeros(len(rows), dtype=np.int64)
+    for i in range(len(rows)):
+        r = rows[i]
+        while r >= 0:
+            lengths[i] += 1
+            r = main_rows[r]
+    depth = max(1, lengths.max()) if len(rows) > 0 else 1
+    branches = np.full((len(rows), depth), -1, dtype=np.int64)
+    for i in range(len(rows)):
+        r = rows[i]
+        j = 0
+        while r >= 0:
+            branches[i, j] = r
+            r = main_rows[r]
+            j += 1
+    return branches
+
+
+def _subtree_sums_numpy(desc_rows, sns, values):
+    # accumulated one snapshot at a time from the earliest
+    sums = values.copy()
+    has_desc = desc_rows >= 0
+    for sn in np.unique(sns[has_desc]):
+        rows = np.flatnonzero(np.logical_and(sns == sn, has_desc))
+        np.add.at(sums, desc_rows[rows], sums[rows])
+    return sums
+
+
+def _subtree_sums_loops(desc_rows, order, values):
+    # order: rows by increasing snapshot
+    sums = values.copy()
+    for r in order:
+        if desc_rows[r] >= 0:
+            sums[desc_rows[r]] += sums[r]
+    return sums
+
+
+def _depths_numpy(desc_rows, sns):
+    # pointer jumping, adding up the steps jumped
+    rows = np.arange(len(desc_rows))
+    has_desc = desc_rows >= 0
+    pointers = np.where(has_desc, desc_rows, rows)
+    depths = has_desc.astype(np.int64)
+    while True:
+        jumped = pointers[pointers]
+        if np.array_equal(jumped, pointers):
+            return depths
+        depths = depths + depths[pointers]
+        pointers = jumped
+
+
+def _depths_loops(desc_rows, order):
+    # order: rows by decreasing snapshot
+    depths = np.zeros(len(desc_rows), dtype=np.int64)
+    for r in order:
+        if desc_rows[r] >= 0:
+            depths[r] = depths[desc_rows[r]] + 1
+    return depths
+
+
+_kernels = {
+    "gather": (_gather_numpy, _gather_loops),
+    "main_branches": (_main_branches_numpy, _main_branches_loops),
+    "subtree_sums": (_subtree_sums_numpy, _subtree_sums_loops),
+    "depths": (_depths_numpy, _depths_loops),
+}
+
+
+@lru_cache(maxsize=None)
+def _compiled(name):
+    # loop version of a kernel compiled with numba, or None without numba
+    try:
+        import numba
+    except ImportError:
+        return None
+    logger.debug("Compiling %s kernel with numba.", name)
+    return numba.njit(cache=True)(_kernels[name][1])
+
+
+def _kernel(name):
+    # (compiled, function) for the kernel in the backend in use
+    if backend == "numpy":
+        return False, _kernels[name][0]
+    compiled = _compiled(name)
+    if compiled is not None:
+        return True, compiled
+    if backend == "numba":
+        raise ImportError("simtrees: the numba backend requires numba.")
+    return False, _kernels[name][0]
+
+
+def _gather(offsets, children, rows):
+    # rows of the children of rows, children of each row listed in reverse,
+    # with those of row r in children[offsets[r]: offsets[r + 1]]
+    compiled, kernel = _kernel("gather")
+    return kernel(offsets, children, np.asarray(rows, dtype=np.int64))
+
+
+def _main_branches(rows, main_rows):
+    # rows along the main branches from rows, one branch per row of the
+    # result, padded with -1; main_rows gives the next row of each row
+    compiled, kernel = _kernel("main_branches")
+    return kernel(np.asarray(rows, dtype=np.int64), main_rows)
+
+
+def _subtree_sums(desc_rows, sns, values):
+    # values summed over the subtree rooted at each row
+    compiled, kernel = _kernel("subtree_sums")
+    if compiled:
+        return kernel(desc_rows, np.argsort(sns, kind="stable"), values)
+    return kernel(desc_rows, sns, values)
+
+
+def _depths(desc_rows, sns):
+    # number of steps from each row to its final descendant
+    compiled, kernel = _kernel("depths")
+    if compiled:
+        return kernel(desc_rows, np.argsort(sns, kind="stable")[::-1])
+    return kernel(desc_rows, sns)
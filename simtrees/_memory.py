@@ -0,0 +1,82 @@
+import numpy as np
+import sys
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _rss():
+    # current resident set size of this process in bytes (None if unknown)
+    if resource is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize()
+
+
+def _peak_rss():
+    # peak resident set size of this process in bytes (None if unknown)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _nbytes(value):
+    # memory held by value: array data, plus the dicts, lists and tuples
+    # holding arrays, including their own overhead
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _nbytes(k) + _nbytes(v) for k, v in value.items()
+        )
+    elif isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_nbytes(v) for v in value)
+    else:
+        return sys.getsizeof(value)
+
+
+class _MemoryProfile:
+    # record of memory use at the end of each stage of work, with the peak
+    # of traced (python) allocations during the stage; stages may be nested
+
+    def __init__(self):
+        self.stages = []
+        self._peaks = []
+        return
+
+    def _fold(self):
+        # carry the traced peak so far into every open stage
+        current, peak = tracemalloc.get_traced_memory()
+        self._peaks = [max(p, peak) for p in self._peaks]
+        return current
+
+    def enter(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._fold()
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+        return
+
+    def exit(self, stage, attributes):
+        current = self._fold()
+        self.stages.append(
+            {
+                "stage": stage,
+                "rss": _rss(),
+                "peak_rss": _peak_rss(),
+                "traced": current,
+                "traced_peak": self._peaks.pop(),
+                "attributes": attributes,
+            }
+        )
+        return
@@ -0,0 +1,71 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class _SharedArrays:
+    # a dict of arrays held in shared memory; instances pickle to a small
+    # description of the blocks, and unpickling attaches to the existing
+    # blocks instead of copying the data
+
+    def __init__(self, arrays):
+        self._owner = True
+        self._specs = dict()
+        self._blocks = dict()
+        self._arrays = dict()
+        for name, array in arrays.items():
+            if array is None:
+                self._specs[name] = None
+                continue
+            array = np.asarray(array)
+            block = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1)
+            )
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            view[...] = array
+            self._blocks[name] = block
+            self._specs[name] = (
+                block.name,
+                array.shape,
+                np.lib.format.dtype_to_descr(array.dtype),
+            )
+            self._arrays[name] = view
+        return
+
+    def __getstate__(self):
+        return {"_specs": self._specs}
+
+    def __setstate__(self, state):
+        self._owner = False
+        self._specs = state["_specs"]
+        self._blocks = dict()
+        self._arrays = dict()
+        for name, spec in self._specs.items():
+            if spec is None:
+                continue
+            blockname, shape, dtype = spec
+            try:
+                block = shared_memory.SharedMemory(name=blockname, track=False)
+            except TypeError:  # python < 3.13 has no track argument
+                block = shared_memory.SharedMemory(name=blockname)
+            self._blocks[name] = block
+            self._arrays[name] = np.ndarray(
+                shape,
+                dtype=np.lib.format.descr_to_dtype(dtype),
+                buffer=block.buf,
+            )
+        return
+
+    def arrays(self):
+        return {
+            name: self._arrays.get(name) for name in self._specs.keys()
+        }
+
+    def close(self):
+        # views handed out by arrays() must be dropped before calling this
+        self._arrays = dict()
+        for block in self._blocks.values():
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._blocks = dict()
+        return
@@ -1,12 +1,41 @@
 import numpy as np
-from ._hdf5_io import hdf5_get
+import multiprocessing
+from ._hdf5_io import hdf5_get, hdf5_sizes, hdf5_chunks
 from importlib.util import spec_from_file_location, module_from_spec
-from os.path import expanduser
-from ._util import _log
-import astropy.units as U
+import os
+import logging
+from os.path import expanduser, abspath
+from inspect import signature
+from time import perf_counter
+from ._util import (
+    logger,
+    _record,
+    _tally,
+    _Stage,
+    _no_stage,
+    _unit,
+    _intervals,
+)
+from ._columns import _ColumnMap, _GroupMap, _match, _padding, _pieces
+from ._shared import _SharedArrays
+from ._memory import _MemoryProfile, _nbytes, _rss, _peak_rss
+from ._store import _Store, _Buckets
+from ._join import join_ids
+from ._forest import (
+    _descendant_rows,
+    _balance,
+    _main_progenitor_rows,
+    _mergers,
+    _jump,
+    _children,
+)
+from ._kernels import _gather, _main_branches, _subtree_sums, _depths
+from ._frames import _table_columns, _to_pandas, _to_arrow
 
 h = 0.704  # dimensionless Hubble constant
-print("Using h={0:.3f}".format(h))
+
+# most intervals read per snapshot catalogue in use_snapshots mode
+_max_intervals = 16
 
 
 class _Node:
@@ -25,23 +54,13 @@ class _Node:
             "tree": self._tree,
             "treetables": self._treetables,
         }
-        self.progs = np.array(
-            [
-                _Node(key, **kwargs)
-                for key, value in self._treetables.tree_descid.items()
-                if ((value == self.key) and (key != self.key))
-            ]
-        )
-        self.progs = list(self.progs[self._argsort_progs(self.progs)])
-        return self.progs
-
-    def _argsort_progs(self, progs):
-        # order progenitors by decreasing mbpc - most bound particles
+        # progenitors come ordered by decreasing mbpc - most bound particles
         # contributed
-        keys = [prog.key for prog in progs]
-        return np.argsort([self._treetables.tree_mbpc[key] for key in keys])[
-            ::-1
+        self.progs = [
+            _Node(key, **kwargs)
+            for key in self._treetables._progenitors(self.key)
         ]
+        return self.progs
 
 
 class _Root(_Node):
@@ -53,12 +72,13 @@ class _Root(_Node):
 
 class Tree:
     def __init__(self, group, treetables=None):
-        _log("Tree: beginning re-construction.")
         self.treetables = treetables
+        start = perf_counter()
         self.root = _Root(group, tree=self, treetables=self.treetables)
         self.nodes = {self.root.key: self.root}
         to_grow = self.root._grow()
         snaplevel = 0
+        debug = logger.isEnabledFor(logging.DEBUG)
         while to_grow != []:
             for node in to_grow:
                 self.nodes[node.key] = node
@@ -66,28 +86,316 @@ class Tree:
             for node in to_grow:
                 to_grow_next += node._grow()
             to_grow = to_grow_next
-            _log(
-                "  level: {0:.0f}, total nodes: {1:.0f},"
-                " nodes in next level: {2:.0f}".format(
-                    snaplevel, len(self.nodes), len(to_grow)
+            if debug:
+                logger.debug(
+                    "Tree: level %d, total nodes %d, nodes in next level"
+                    " %d.",
+                    snaplevel,
+                    len(self.nodes),
+                    len(to_grow),
                 )
-            )
             snaplevel += 1
         self._make_trunk()
-        _log("Tree: re-construction complete.")
+        treetables._grown(perf_counter() - start, len(self.nodes))
         return
 
+    def trunk_array(self, field):
+        """
+        Values of a column along the trunk.
+
+        Parameters
+        ----------
+        field: str
+            Column name, see TreeTables.history().
+
+        Returns
+        -------
+        out : ndarray or Quantity
+            Values for the nodes of the trunk, from the root back.
+        """
+
+        return self.treetables._values(
+            [node.key for node in self.trunk], field
+        )
+
+    def to_pandas(self):
+        """
+        Table of the nodes of the tree, as a pandas DataFrame.
+
+        See TreeTables.to_pandas(). Requires pandas.
+
+        Returns
+        -------
+        out : DataFrame
+            A row per node, in the order of self.nodes.
+        """
+
+        return _to_pandas(self.treetables._table(self._rows()))
+
+    def to_arrow(self):
+        """
+        Table of the nodes of the tree, as a pyarrow Table.
+
+        See TreeTables.to_arrow(). Requires pyarrow.
+
+        Returns
+        -------
+        out : Table
+            A row per node, in the order of self.nodes.
+        """
+
+        return _to_arrow(self.treetables._table(self._rows()))
+
+    def _rows(self):
+        return self.treetables._rows(np.fromiter(self.nodes, dtype=np.int64))
+
     def _make_trunk(self):
         self.trunk = [self.root]
         while self.trunk[-1].progs:
             self.trunk.append(self.trunk[-1].progs[0])
         return
 
+    def _flatten(self):
+        # keys of the nodes in the order of self.nodes, and the position in
+        # that order of the descendant of each (-1 for the root): the tree
+        # as flat arrays, to send it back from a worker process without
+        # pickling the linked nodes, which recurses once per generation
+        positions = {key: i for i, key in enumerate(self.nodes)}
+        keys = np.fromiter(self.nodes, dtype=np.int64, count=len(positions))
+        descs = np.fromiter(
+            (
+                -1 if node.desc is None else positions[node.desc.key]
+                for node in self.nodes.values()
+            ),
+            dtype=np.int64,
+            count=len(positions),
+        )
+        return keys, descs
+
+    @classmethod
+    def _unflatten(cls, keys, descs, treetables):
+        # rebuild a tree from _flatten(); descendants come before their
+        # progenitors, and progenitors in the order of their descendant's
+        # progs
+        tree = cls.__new__(cls)
+        tree.treetables = treetables
+        tree.nodes = dict()
+        nodes = []
+        for key, desc in zip(keys.tolist(), descs.tolist()):
+            if desc < 0:
+                node = _Root.__new__(_Root)
+                _Node.__init__(node, key, tree=tree, treetables=treetables)
+                tree.root = node
+            else:
+                node = _Node(
+                    key, desc=nodes[desc], tree=tree, treetables=treetables
+                )
+                nodes[desc].progs.append(node)
+            node.progs = []
+            nodes.append(node)
+            tree.nodes[key] = node
+        tree._make_trunk()
+        return tree
+
+
+# state of the worker processes of TreeTables.build_trees_parallel
+_pool_treetables = None
+
+
+def _pool_init(treetables):
+    global _pool_treetables
+    _pool_treetables = treetables
+    return
+
+
+def _pool_build(batch, reduce):
+    results = []
+    for i, group in batch:
+        tree = Tree(group, treetables=_pool_treetables)
+        if reduce is None:
+            results.append((i, tree._flatten()))
+        else:
+            results.append((i, reduce(tree)))
+    return results
+
+
+def _read_snapshot(task):
+    # read the rows at tabposs of a snapshot's subfind catalogue
+    from simfiles import SimFiles
+
+    snap_id, simfiles_config, ncpu, keys, tabposs = task
+    start_time = perf_counter()
+    SF = SimFiles(snap_id, configfile=simfiles_config, ncpu=ncpu)
+    order = np.argsort(tabposs, kind="stable")
+    positions = tabposs[order]
+    if "intervals" in signature(SF.load).parameters:
+        # read only the stretches of the catalogue holding tree nodes
+        intervals = _intervals(positions, _max_intervals)
+    else:
+        intervals = [None]
+    chunks = {key: [] for key in keys}
+    units = dict()
+    for interval in intervals:
+        if interval is None:
+            SF.load(keys=keys)
+            start, these = 0, positions
+        else:
+            SF.load(keys=keys, intervals=(interval,) * len(keys))
+            start, end = interval
+            these = positions[
+                np.searchsorted(positions, start):np.searchsorted(
+                    positions, end
+                )
+            ]
+        for key in keys:
+            tf_values = getattr(SF, key)
+            chunks[key].append(tf_values.value[these - start])
+            units[key] = tf_values.unit.to_string()
+            del SF[key]
+    del SF
+    values = dict()
+    for key in keys:
+        chunk = np.concatenate(chunks[key])
+        values[key] = (np.empty_like(chunk), units[key])
+        values[key][0][order] = chunk
+    seconds = perf_counter() - start_time
+    return snap_id.snap, values, seconds
+
 
 # TreeTables not a subclass of Tree since many Tree instances may share a
 # TreeTables instance
-# TreeTable instances are pickle-able
+# TreeTable instances are pickle-able, and once share() has been called they
+# pickle to a handle on their shared memory rather than to a copy of the data
 class TreeTables:
+    """
+    Merger tree tables of a forest, with the subfind values of their nodes.
+
+    Columns are kept as arrays sorted by node index, one row per tree node;
+    rows of nodes without a subfind entry (interpolated nodes) are padded
+    with NaN or -1 in the subfind columns. Positions are comoving, in Mpc
+    (not Mpc/h: the subfind values are divided by h), masses in Msun and
+    velocities in km/s.
+
+    Parameters
+    ----------
+    snap_id: hashable
+        Key of the tree files in the configfile. In use_snapshots mode, a
+        simfiles snapshot identifier (a namedtuple with a 'snap' field).
+
+    configfile: str
+        Python file defining paths = {snap_id: (path, fbase, sfbase)}: the
+        directory of the tree files, and the base names of the tree and
+        subfind tables (omit '.X.hdf5' portion).
+
+    ncpu: int
+        Read in parallel with the given cpu count (0 -> all cpus). In
+        use_snapshots mode, the number of snapshots read at once.
+
+    phantom: int
+        Offset of the node indices of interpolated nodes, which are not
+        listed in sub_groups_r.
+
+    simfiles_config: str
+        Configfile of simfiles (use_snapshots mode).
+
+    use_snapshots: bool
+        Read the subfind values from the snapshot catalogues with simfiles,
+        at the positions in the catalogues given by the tree tables, rather
+        than from the subfind tables. Positions and velocities are then
+        returned without units.
+
+    units: bool
+        Return values as astropy Quantities (False -> plain arrays, in the
+        units above).
+
+    columns: iterable
+        Subfind columns to read at once, of 'sgns', 'cops', 'vels' and
+        'masstypes' (default: None -> all); others are read on first use.
+
+    boxsize: float or Quantity
+        Side of the periodic simulation box, comoving, in Mpc if given
+        without units (not Mpc/h: e.g. 100 / h for a 100 Mpc/h box). Used
+        to wrap positions in neighbours(), query_ball() and interpolated
+        positions (default: None -> no periodic box).
+
+    checkpoint_dir: str
+        Directory to save the values read from each snapshot in
+        (use_snapshots mode), so that an interrupted build resumes by
+        reading only the snapshots still missing (optional).
+
+    instrument: bool
+        Record the time taken by each stage of work in the timings
+        attribute, a list with an entry per stage, and log it.
+
+    profile_memory: bool
+        Record memory use at the end of each stage of work, see
+        memory_report(); traces python allocations, slowing things down.
+
+    store: str
+        Directory for out-of-core mode (optional): columns and derived
+        indices are kept on disk there, built from the tree files on first
+        use, and read in blocks through a cache. A store holds the tables
+        of one set of tree files. Not supported with use_snapshots, parts
+        or roots. Queries over the whole forest (e.g. final_descendant(),
+        depth(), mergers()) still hold arrays of a few int64 per row in
+        memory.
+
+    cache_bytes: int
+        Most bytes of column blocks held in memory in out-of-core mode.
+
+    parts: iterable
+        Indices of the part files of the tree files to read, each holding
+        whole trees (default: None -> all, unless roots are given). Only
+        the same parts of the subfind files are read, unless they lack
+        nodes of those trees.
+
+    roots: iterable
+        Groups, as (snapshot, fof, subgroup) tuples, whose trees to read:
+        the parts holding their fof groups are read, along with any parts
+        given (optional).
+
+    interpolate: bool
+        Fill in the positions, velocities and masses of interpolated nodes
+        where values are gathered by node (e.g. history(), to_pandas()),
+        interpolating linearly in snapshot number between their nearest
+        progenitor and descendant with subfind entries.
+    """
+
+    # lazily derived index arrays, and the method computing each of them
+    _derived = {
+        "rows": "_index_rows",
+        "keys": "_index_rows",
+        "sub_rows": "_index_rows",
+        "sub_keys": "_index_rows",
+        "group_rows": "_reverse",
+        "groups": "_reverse",
+        "prog_rows": "_index_progenitors",
+        "prog_descids": "_index_progenitors",
+        "desc_rows": "_index_descendants",
+        "main_rows": "_index_main",
+        "final_rows": "_index_final",
+        "branch_ends": "_index_branch_ends",
+        "interp_rows": "_index_interpolation",
+        "interp_progs": "_index_interpolation",
+        "interp_descs": "_index_interpolation",
+        "child_offsets": "_index_children",
+        "child_rows": "_index_children",
+    }
+
+    # derived indices moved into shared memory by share(), those needed to
+    # grow trees; the others are derived on demand by each process
+    _shared_indices = ("groups", "group_rows", "prog_descids", "prog_rows")
+
+    # subfind columns: dataset, simfiles key (use_snapshots mode), unit and
+    # scaling of the stored values
+    _subfind_columns = {
+        "sgns": ("/Subhalo/SubGroupNumber", "sgns", None, None),
+        # Comoving!
+        "cops": ("/Subhalo/CentreOfPotential", "cops", "Mpc", 1 / h),
+        "vels": ("/Subhalo/Velocity", "vcents", "km / s", None),
+        "masstypes": ("/Subhalo/MassType", "msubfind", "Msun", 1e10 / h),
+    }
+
     def __init__(
         self,
         snap_id,
@@ -96,6 +404,17 @@ class TreeTables:
         phantom=10000000000000000,
         simfiles_config=None,
         use_snapshots=False,
+        units=True,
+        columns=None,
+        boxsize=None,
+        checkpoint_dir=None,
+        instrument=True,
+        profile_memory=False,
+        store=None,
+        cache_bytes=1073741824,
+        parts=None,
+        roots=None,
+        interpolate=False,
     ):
 
         self.snap_id = snap_id
@@ -104,221 +423,2045 @@ class TreeTables:
         self.phantom = phantom
         self.simfiles_config = simfiles_config
         self.use_snapshots = use_snapshots
+        self.units = units
+        self.boxsize = boxsize
+        self.checkpoint_dir = checkpoint_dir
+        # fill in positions, velocities and masses of interpolated nodes
+        # where values are gathered along branches (see _take())
+        self.interpolate = interpolate
+        self._shared = None
+        # filter in place when share() was called
+        self._shared_mask = None
+        # machine-readable record of the time taken by each stage of work
+        self.timings = [] if instrument else None
+        # memory use at the end of each stage (see memory_report())
+        self._memory = _MemoryProfile() if profile_memory else None
+        # intervals of rows read from the files with each base name, when
+        # only some of the trees are loaded
+        self._intervals = dict()
+        # parts of the tree files read, when only some of the trees are
+        # loaded
+        self._parts = None
+        # units of the columns read from snapshots (use_snapshots mode),
+        # where positions and velocities are returned without units
+        self._snapshot_units = dict()
 
         self._read_config()
-        self._read_treetables()
-
-        self.sgns = dict()
-        self.cops = dict()
-        self.vels = dict()
-        self.masstypes = dict()
-        if self.use_snapshots:
-            self._read_snapshots()
+        if parts is not None or roots is not None:
+            if store is not None:
+                raise ValueError(
+                    "TreeTables: parts and roots are not supported with store."
+                )
+            self._select_parts(parts, roots)
+        if store is None:
+            self._store = None
+            self._read_treetables()
+            self._sort_tables()
         else:
-            self._read_subfindtables()
-        self._sort_tables()
-        self._reverse()
+            # out-of-core mode: columns are kept on disk in the store
+            # directory (repacked from the tree files on first use, a chunk
+            # at a time) and read in blocks through a cache of at most
+            # cache_bytes; building the columns and the indices used to grow
+            # trees takes memory of the order of cache_bytes
+            if use_snapshots:
+                raise ValueError(
+                    "TreeTables: store is not supported with use_snapshots."
+                )
+            self._store = _Store(store, cache_bytes=cache_bytes)
+            self._open_store()
+        if columns is None:
+            columns = self._subfind_columns.keys()
+        self._load(columns)
 
-        # explicit deletions to clean up memory a bit
-        del self.tree_ids
-        del self.tree_descids, self.tree_mbpcs
-        del self.in_tab, self.sns, self.gns, self.sgns
-        del self.cops, self.vels, self.masstypes
-        if self.use_snapshots:
-            del self.tree_tabposs
+        logger.info("TreeTables initialized.")
 
-        _log("TreeTables initialized.")
+        return
+
+    def _stage(self, name):
+        # context manager timing a stage of work into self.timings, or doing
+        # nothing if instrumentation is off
+        if self.timings is None and self._memory is None:
+            return _no_stage
+        return _Stage(
+            self.timings, name, memory=self._memory, attributes=self._sizes
+        )
 
+    def _grown(self, seconds, rows):
+        # count a tree grown into a single "grow trees" entry of
+        # self.timings, rather than timing each tree as a stage
+        if self.timings is not None:
+            _tally(self.timings, "grow trees", seconds, rows=rows)
+        return
+
+    def _sizes(self):
+        # bytes held by each attribute
+        return {name: _nbytes(value) for name, value in self.__dict__.items()}
+
+    def _table(self, rows=None):
+        # (name, values, unit, components) columns of to_pandas() and
+        # to_arrow() for rows (default: the visible rows); with all rows
+        # visible, the columns themselves, so nothing is copied
+        if rows is None:
+            rows = self._derive("rows")
+        table = []
+        for name, column, components in _table_columns:
+            if rows is not None:
+                values = self._take(column, rows)
+            elif self.interpolate and column in self._interpolated:
+                values = self._take(
+                    column, np.arange(len(self._columns["ids"]))
+                )
+            else:
+                values = np.asarray(self._column(column))
+            table.append((name, values, self._units.get(column), components))
+        return table
+
+    def to_pandas(self):
+        """
+        Table of the nodes, as a pandas DataFrame.
+
+        The columns are 'key', 'descendant', 'snapshot', 'fof', 'sgn', and a
+        column per component of 'cop' ('cop_x', ...), 'vel' and 'masstypes'
+        ('masstypes_0', ... by particle type). Values are in the units of
+        the tables (Msun, Mpc, km/s), listed in the attrs['units'] of the
+        DataFrame, and NaN (or -1) for nodes without subfind entries.
+
+        Without a filter applied, the DataFrame holds the columns of the
+        tables rather than copies where pandas allows. Otherwise (and in
+        out-of-core mode, see store) the values are copied. Requires pandas.
+
+        Returns
+        -------
+        out : DataFrame
+            A row per node, ordered by key.
+        """
+
+        return _to_pandas(self._table())
+
+    def to_arrow(self):
+        """
+        Table of the nodes, as a pyarrow Table.
+
+        The columns are as for to_pandas(), except that 'cop', 'vel' and
+        'masstypes' are fixed-size list columns, and units are given in the
+        metadata of the fields.
+
+        Without a filter applied, the Table wraps the columns of the tables
+        without copying them. Otherwise (and in out-of-core mode, see
+        store) the values are copied. Requires pyarrow.
+
+        Returns
+        -------
+        out : Table
+            A row per node, ordered by key.
+        """
+
+        return _to_arrow(self._table())
+
+    def memory_report(self):
+        """
+        Report the memory used by the TreeTables.
+
+        Stage-by-stage figures are only recorded when the TreeTables was
+        created with profile_memory=True, which traces python allocations
+        with tracemalloc (slowing things down) from then on. Sizes of
+        arrays in shared memory (see share()) are counted in full.
+
+        Returns
+        -------
+        out : dict
+            Current resident set size ('rss'), its peak ('peak_rss') and the
+            bytes held by each attribute, dict overheads included
+            ('attributes'); and under 'stages' a list with an entry for each
+            stage of work done so far, giving these figures at the end of the
+            stage along with the current and peak traced allocations
+            ('traced', 'traced_peak') during the stage.
+        """
+
+        return {
+            "rss": _rss(),
+            "peak_rss": _peak_rss(),
+            "attributes": self._sizes(),
+            "stages": [] if self._memory is None else self._memory.stages,
+        }
+
+    def _read(self, fbase, hpath):
+        with self._stage("read " + hpath) as stage:
+            if fbase not in self._intervals:
+                values = hdf5_get(self.fpath, fbase, hpath, ncpu=self.ncpu)
+            else:
+                values = np.concatenate(
+                    [
+                        hdf5_get(
+                            self.fpath,
+                            fbase,
+                            hpath,
+                            ncpu=self.ncpu,
+                            interval=interval,
+                        )
+                        for interval in self._intervals[fbase]
+                    ]
+                )
+            stage.record(values)
+        return values
+
+    def _select_parts(self, parts, roots):
+        # restrict reading the tree files to some of their parts (each holds
+        # whole trees): those given, and those holding the fof groups of the
+        # roots at their snapshots
+        sizes = hdf5_sizes(self.fpath, self.fbase, "/haloTrees/nodeIndex")
+        ends = np.cumsum(sizes)
+        starts = ends - np.asarray(sizes)
+        parts = set() if parts is None else set(parts)
+        for part in parts:
+            if not 0 <= part < len(sizes):
+                raise ValueError(
+                    "TreeTables: no part {0} of the tree files (there are "
+                    "{1:d}).".format(part, len(sizes))
+                )
+            if sizes[part] == 0:
+                raise ValueError(
+                    "TreeTables: part {0:d} of the tree files holds no "
+                    "trees.".format(part)
+                )
+        if roots is not None:
+            roots = {(sn, gn) for sn, gn, sgn in roots}
+            found = set()
+            # a chunk per part, each part opened once
+            for part, start, (sns, gns) in hdf5_chunks(
+                self.fpath,
+                self.fbase,
+                ("/haloTrees/snapshotNumber", "/haloTrees/fofIndex"),
+            ):
+                here = roots.intersection(zip(sns.tolist(), gns.tolist()))
+                if len(here) > 0:
+                    parts.add(part)
+                    found.update(here)
+            if len(found) < len(roots):
+                logger.warning(
+                    "TreeTables: %d root groups not found in tree files.",
+                    len(roots) - len(found),
+                )
+        parts = sorted(parts)
+        if len(parts) == 0:
+            raise ValueError("TreeTables: no parts of the tree files to read.")
+        logger.info("TreeTables: reading parts %s of tree files.", parts)
+        # adjacent parts are read as one interval
+        intervals = []
+        for part in parts:
+            if len(intervals) > 0 and intervals[-1][1] == starts[part]:
+                intervals[-1] = (intervals[-1][0], int(ends[part]))
+            else:
+                intervals.append((int(starts[part]), int(ends[part])))
+        self._intervals[self.fbase] = intervals
+        self._parts = parts
         return
 
     def _read_treetables(self):
-        _log("TreeTables: reading merger tree tables:")
-        _log("  nodeIndex")
-        self.tree_ids = hdf5_get(
-            self.fpath, self.fbase, "/haloTrees/nodeIndex", ncpu=self.ncpu
-        )
-        _log("  snapshotNumber")
-        self.sns = hdf5_get(
-            self.fpath, self.fbase, "/haloTrees/snapshotNumber", ncpu=self.ncpu
+        logger.info("TreeTables: reading merger tree tables.")
+        self.tree_ids = self._read(self.fbase, "/haloTrees/nodeIndex")
+        self.sns = self._read(self.fbase, "/haloTrees/snapshotNumber")
+        self.gns = self._read(self.fbase, "/haloTrees/fofIndex")
+        if self.use_snapshots:
+            self.tree_tabposs = self._read(
+                self.fbase, "/haloTrees/positionInCatalogue"
+            )
+        self.in_tab = np.logical_not(
+            self._read(self.fbase, "/haloTrees/isInterpolated")
         )
-        _log("  fofIndex")
-        self.gns = hdf5_get(
-            self.fpath, self.fbase, "/haloTrees/fofIndex", ncpu=self.ncpu
+        self.tree_descids = self._read(
+            self.fbase, "/haloTrees/descendantIndex"
         )
+        self.tree_mbpcs = self._read(self.fbase, "/haloTrees/mbpsContributed")
+
+        return
+
+    # tree columns and their datasets, in out-of-core mode
+    _tree_columns = {
+        "descids": "/haloTrees/descendantIndex",
+        "mbpcs": "/haloTrees/mbpsContributed",
+        "sns": "/haloTrees/snapshotNumber",
+        "gns": "/haloTrees/fofIndex",
+        "in_tab": "/haloTrees/isInterpolated",
+    }
+
+    # arrays in the store that are not columns of the tables: the row of
+    # the tree node of each subfind entry
+    _store_arrays = ("sf_dest",)
+
+    def _open_store(self):
+        metadata = {
+            "fpath": abspath(expanduser(self.fpath)),
+            "fbase": self.fbase,
+            "sfbase": self.sfbase,
+            "phantom": int(self.phantom),
+        }
+        saved = self._store.metadata()
+        if saved is None and len(self._store.names()) == 0:
+            self._store.save_metadata(metadata)
+        elif saved != metadata:
+            raise ValueError(
+                "TreeTables: store '{0:s}' holds columns built from other "
+                "tree files ({1}); use another directory.".format(
+                    self._store.directory, saved
+                )
+            )
+        names = ("ids",) + tuple(self._tree_columns)
+        if any(name not in self._store for name in names):
+            self._repack_treetables()
+        # derived indices are in the store too, but not columns
+        self._columns = {
+            name: self._store[name]
+            for name in self._store.names()
+            if name not in self._derived and name not in self._store_arrays
+        }
+        self._units = self._column_units()
+        self._mask = None
+        self._index = dict()
+        return
+
+    def _repack_treetables(self):
+        # write the tree columns sorted by node index to the store, a chunk
+        # of rows at a time: node indices are distributed by range into
+        # buckets small enough to sort in memory, giving the row of each
+        # node in the sorted columns, and the columns are scattered to those
+        # rows
+        logger.info("TreeTables: repacking merger tree tables to store.")
+        chunk_rows = self._store.chunk_rows
+        hpath = "/haloTrees/nodeIndex"
+        nrows = sum(hdf5_sizes(self.fpath, self.fbase, hpath))
+        nbuckets = max(-(-2 * nrows // chunk_rows), 1)
+        with self._stage("sample node indices") as stage:
+            step = max(nrows // (256 * nbuckets), 1)
+            sample = np.sort(
+                np.concatenate(
+                    [
+                        ids[(-start) % step:: step].copy()
+                        for part, start, (ids,) in self._chunks(
+                            self.fbase, (hpath,)
+                        )
+                    ]
+                )
+            )
+            bounds = sample[
+                len(sample) * np.arange(1, nbuckets) // nbuckets
+            ]
+            stage.record(rows=nrows)
+        with _Buckets(self._store._path("ids") + ".buckets") as buckets:
+            with self._stage("distribute node indices") as stage:
+                for part, start, (ids,) in self._chunks(self.fbase, (hpath,)):
+                    buckets.add(
+                        np.searchsorted(bounds, ids, side="right"),
+                        ids=ids,
+                        positions=np.arange(start, start + len(ids)),
+                    )
+                stage.record(rows=nrows)
+            with self._stage("sort tree tables") as stage:
+                # ids under another name until the other columns are done
+                self._store.save_scattered(
+                    "repack_rows",
+                    nrows,
+                    self._sort_buckets(buckets, nbuckets, nrows),
+                    padded=False,
+                )
+                stage.record(rows=nrows)
+        rows = self._store["repack_rows"]
+        for name, hpath in self._tree_columns.items():
+            with self._stage("write " + name) as stage:
+                self._store.save_scattered(
+                    name,
+                    nrows,
+                    (
+                        (
+                            rows[start: start + len(values)],
+                            np.logical_not(values)
+                            if name == "in_tab"
+                            else values,
+                        )
+                        for part, start, (values,) in self._chunks(
+                            self.fbase, (hpath,)
+                        )
+                    ),
+                    padded=False,
+                )
+                stage.record(rows=nrows)
+        self._store.remove("repack_rows")
+        # ids last: a store with ids has all the tree columns
+        self._store.rename("repack_ids", "ids")
+        return
+
+    def _sort_buckets(self, buckets, nbuckets, nrows):
+        # sort the node indices a bucket at a time, saving them in order, and
+        # yield the positions in the tree files and rows in the sorted columns
+        # of the nodes
+        row = 0
+        dtype = buckets.dtype("ids")
+        with self._store._writer("repack_ids", nrows, dtype) as write:
+            for b in range(nbuckets):
+                ids = buckets.get(b, "ids")
+                order = np.argsort(ids, kind="stable")
+                write(ids[order])
+                yield (
+                    buckets.get(b, "positions")[order],
+                    np.arange(row, row + len(order)),
+                )
+                row += len(order)
+        return
+
+    def _chunks(self, fbase, hpaths):
+        # chunks of rows of datasets, to build the columns of the store
+        return hdf5_chunks(self.fpath, fbase, hpaths, self._store.chunk_rows)
+
+    def _load(self, names):
+        # read subfind columns not yet in memory (or in the store)
+        names = [name for name in names if name not in self._columns]
+        if len(names) == 0:
+            return
         if self.use_snapshots:
-            _log("  positionInCatalogue")
-            self.tree_tabposs = hdf5_get(
-                self.fpath,
-                self.fbase,
-                "/haloTrees/positionInCatalogue",
-                ncpu=self.ncpu,
+            values = self._read_snapshots(names)
+        else:
+            values = self._read_subfindtables(names)
+        self._columns.update(values)
+        return
+
+    def _column(self, name):
+        if name not in self._columns:
+            self._load((name,))
+        return self._columns[name]
+
+    def _read_snapshots(self, names):
+        keys = tuple(self._subfind_columns[name][1] for name in names)
+        sns = self._columns["sns"]
+        in_tab = self._columns["in_tab"]
+        # rows with subfind entries, grouped by snapshot
+        rows = np.flatnonzero(in_tab)
+        rows = rows[np.argsort(sns[rows], kind="stable")]
+        unique_sns, starts = np.unique(sns[rows], return_index=True)
+        snap_rows = dict(zip(unique_sns, np.split(rows, starts[1:])))
+        snap_tabposs = {
+            sn: self._columns["tabposs"][snap_rows[sn]] for sn in unique_sns
+        }
+        if self.checkpoint_dir is not None:
+            os.makedirs(expanduser(self.checkpoint_dir), exist_ok=True)
+            todo = [
+                sn
+                for sn in unique_sns
+                if not self._checkpointed(sn, keys, snap_tabposs[sn])
+            ]
+            logger.info(
+                "TreeTables: resuming, %d snapshots already read.",
+                len(unique_sns) - len(todo),
             )
-        _log("  isInterpolated")
-        self.in_tab = np.logical_not(
-            hdf5_get(
-                self.fpath,
-                self.fbase,
-                "/haloTrees/isInterpolated",
-                ncpu=self.ncpu,
+        else:
+            todo = unique_sns
+        nproc = self.ncpu if self.ncpu > 0 else multiprocessing.cpu_count() - 1
+        nproc = max(min(nproc, len(todo)), 1)
+        # several snapshots in flight at once, each read serially; or one
+        # snapshot at a time, read in parallel
+        tasks = (
+            (
+                self.snap_id._replace(snap=sn),
+                self.simfiles_config,
+                1 if nproc > 1 else self.ncpu,
+                keys,
+                snap_tabposs[sn],
             )
+            for sn in todo
         )
-        _log("  descendantIndex")
-        self.tree_descids = hdf5_get(
-            self.fpath,
-            self.fbase,
-            "/haloTrees/descendantIndex",
-            ncpu=self.ncpu,
+        logger.info("TreeTables: reading snapshots.")
+        values = dict()
+        if nproc > 1:
+            pool = multiprocessing.Pool(nproc)
+            results = pool.imap_unordered(_read_snapshot, tasks)
+        else:
+            pool = None
+            results = map(_read_snapshot, tasks)
+        with self._stage("read snapshots"):
+            try:
+                for i, (sn, tf_values, seconds) in enumerate(results):
+                    logger.debug(
+                        "TreeTables: read snapshot %d (%d/%d).",
+                        sn,
+                        len(unique_sns) - len(todo) + i + 1,
+                        len(unique_sns),
+                    )
+                    if self.timings is not None:
+                        _record(
+                            self.timings,
+                            "read snapshot {0:d}".format(sn),
+                            seconds,
+                            rows=len(snap_rows[sn]),
+                            nbytes=sum(
+                                column.nbytes
+                                for column, unit in tf_values.values()
+                            ),
+                        )
+                    if self.checkpoint_dir is None:
+                        self._scatter(
+                            values, names, keys, snap_rows[sn], tf_values
+                        )
+                    else:
+                        self._write_checkpoint(sn, tf_values, snap_tabposs[sn])
+            finally:
+                if pool is not None:
+                    pool.terminate()
+        if self.checkpoint_dir is not None:
+            with self._stage("read checkpoints") as stage:
+                for sn in unique_sns:
+                    tf_values = self._read_checkpoint(sn, keys)
+                    self._scatter(
+                        values, names, keys, snap_rows[sn], tf_values
+                    )
+                    stage.record(rows=len(snap_rows[sn]))
+        return values
+
+    def _scatter(self, values, names, keys, rows, tf_values):
+        # scatter the values read from a snapshot into full columns
+        for name, key in zip(names, keys):
+            column, unit = tf_values[key]
+            if name not in values:
+                values[name] = self._empty(column)
+            values[name][rows] = column
+            self._snapshot_units[name] = unit
+            if name == "masstypes":
+                self._units[name] = unit
+        return
+
+    def _checkpoint(self, sn, key):
+        return os.path.join(
+            expanduser(self.checkpoint_dir),
+            "{0:s}_{1:04d}.npz".format(key, sn),
         )
-        _log("  mbpsContributed")
-        self.tree_mbpcs = hdf5_get(
-            self.fpath,
-            self.fbase,
-            "/haloTrees/mbpsContributed",
-            ncpu=self.ncpu,
+
+    def _checkpointed(self, sn, keys, tabposs):
+        # checkpoints exist, and are for the same catalogue rows
+        for key in keys:
+            try:
+                with np.load(self._checkpoint(sn, key)) as f:
+                    if not np.array_equal(f["tabposs"], tabposs):
+                        return False
+            except (OSError, KeyError, ValueError):
+                return False
+        return True
+
+    def _write_checkpoint(self, sn, tf_values, tabposs):
+        for key, (column, unit) in tf_values.items():
+            # write then rename, so an interrupted write is not mistaken for
+            # a complete checkpoint
+            path = self._checkpoint(sn, key)
+            with open(path + ".tmp", "wb") as f:
+                np.savez(
+                    f, values=column, unit=np.array(unit), tabposs=tabposs
+                )
+            os.replace(path + ".tmp", path)
+        return
+
+    def _read_checkpoint(self, sn, keys):
+        tf_values = dict()
+        for key in keys:
+            with np.load(self._checkpoint(sn, key)) as f:
+                tf_values[key] = (f["values"], str(f["unit"]))
+        return tf_values
+
+    def _read_subfindtables(self, names):
+        logger.info("TreeTables: reading subfind tables (h=%.3f).", h)
+        if self._store is not None:
+            return self._scatter_subfindtables(names)
+        if "sf_rows" not in self._columns:
+            self._sort_subfindtables(*self._read_subfind_ids())
+        values = dict()
+        for name in names:
+            hpath, key, unit, scale = self._subfind_columns[name]
+            tf_values = self._read(self.sfbase, hpath)
+            if scale is not None:
+                tf_values *= scale
+            values[name] = self._gather(name, tf_values)
+        return values
+
+    def _sort_tables(self):
+        with self._stage("sort tree tables") as stage:
+            # store columns sorted by node index, one row per tree node;
+            # subfind columns are read later, rows without a subfind entry
+            # are padded
+            order = np.argsort(self.tree_ids, kind="stable")
+            self._columns = {
+                "ids": self.tree_ids[order],
+                "descids": self.tree_descids[order],
+                "mbpcs": self.tree_mbpcs[order],
+                "sns": self.sns[order],
+                "gns": self.gns[order],
+                "in_tab": self.in_tab[order],
+            }
+            stage.record(rows=len(order))
+        if self.use_snapshots:
+            self._columns["tabposs"] = self.tree_tabposs[order]
+        self._units = self._column_units()
+        self._mask = None
+        self._index = dict()
+
+        # explicit deletions to clean up memory a bit
+        with self._stage("free tree tables"):
+            del self.tree_ids
+            del self.tree_descids, self.tree_mbpcs
+            del self.in_tab, self.sns, self.gns
+            if self.use_snapshots:
+                del self.tree_tabposs
+
+        return
+
+    def _column_units(self):
+        if self.use_snapshots:
+            # positions and velocities are kept without units in this mode
+            return {name: None for name in self._subfind_columns}
+        # columns are stored as plain arrays, units are attached to values on
+        # the way out (unless units=False)
+        return {
+            name: unit
+            for name, (hpath, key, unit, scale) in (
+                self._subfind_columns.items()
+            )
+        }
+
+    def _read_subfind_ids(self):
+        # node indices of the subfind tables, and their positions in them;
+        # with only some parts of the tree files loaded, only the same parts
+        # of the subfind files are read (write_forest() pairs them, each
+        # holding whole trees), and the others only if nodes of the trees
+        # are still missing
+        hpath = "/Subhalo/nodeIndex"
+        if self._parts is None:
+            tf_tree_ids = self._read(self.sfbase, hpath)
+            return tf_tree_ids, np.arange(len(tf_tree_ids))
+        sizes = hdf5_sizes(self.fpath, self.sfbase, hpath)
+        ends = np.cumsum(sizes)
+        starts = ends - np.asarray(sizes)
+        paired = [part for part in self._parts if part < len(sizes)]
+        others = [part for part in range(len(sizes)) if part not in paired]
+        ntab = np.count_nonzero(self._columns["in_tab"])
+        tf_tree_ids, positions = [], []
+        for parts in (paired, others):
+            intervals = [
+                (int(starts[part]), int(ends[part]))
+                for part in parts
+                if sizes[part] > 0
+            ]
+            if len(intervals) == 0:
+                continue
+            self._intervals[self.sfbase] = intervals
+            tf_tree_ids.append(self._read(self.sfbase, hpath))
+            positions.extend(np.arange(*interval) for interval in intervals)
+            tree_rows, sf_rows = join_ids(
+                self._columns["ids"], np.concatenate(tf_tree_ids)
+            )
+            if np.count_nonzero(self._columns["in_tab"][tree_rows]) == ntab:
+                break
+        self._intervals.pop(self.sfbase, None)
+        return (
+            np.concatenate([np.empty(0, dtype=np.int64)] + tf_tree_ids),
+            np.concatenate([np.empty(0, dtype=np.int64)] + positions),
         )
 
+    def _sort_subfindtables(self, tf_tree_ids, positions):
+        # row of the subfind tables for each tree node with an entry in them,
+        # for the node indices read from the subfind tables at positions
+        in_tab = self._columns["in_tab"]
+        with self._stage("join subfind tables") as stage:
+            tree_rows, sf_rows = join_ids(self._columns["ids"], tf_tree_ids)
+            stage.record(rows=len(tf_tree_ids))
+        matched = in_tab[tree_rows]
+        tree_rows, sf_rows = tree_rows[matched], positions[sf_rows[matched]]
+        nmissing = np.sum(in_tab) - len(tree_rows)
+        if nmissing > 0:
+            logger.warning(
+                "TreeTables: %d nodes missing from subfind tables.", nmissing
+            )
+        if self.fbase in self._intervals:
+            # only some of the trees are loaded: read only the stretches of
+            # the subfind tables holding their nodes from now on
+            sf_rows = self._restrict(self.sfbase, sf_rows)
+        rows = np.full(len(in_tab), -1, dtype=np.int64)
+        rows[tree_rows] = sf_rows
+        self._columns["sf_rows"] = rows
         return
 
-    def _read_snapshots(self):
-        from simfiles import SimFiles
-        unique_sns = np.unique(self.sns)
-        _log("TreeTables: Reading snapshots...")
-        for i, sn in enumerate(unique_sns):
-            _log("{0:.0f}/{1:.0f}".format(i + 1, len(unique_sns)))
-            SF = SimFiles(
-                self.snap_id._replace(snap=sn),
-                configfile=self.simfiles_config,
-                ncpu=self.ncpu,
+    def _scatter_subfindtables(self, names):
+        # out-of-core counterpart of reading and gathering the subfind
+        # tables: their rows are scattered to the rows of the tree nodes, a
+        # chunk at a time
+        if "sf_dest" not in self._store:
+            self._join_subfindtables()
+        sf_dest = self._store["sf_dest"]
+        nrows = len(self._columns["ids"])
+        values = dict()
+        for name in names:
+            hpath, key, unit, scale = self._subfind_columns[name]
+            with self._stage("write " + name) as stage:
+                values[name] = self._store.save_scattered(
+                    name,
+                    nrows,
+                    self._subfind_pieces(hpath, scale, sf_dest),
+                )
+                stage.record(rows=nrows)
+        return values
+
+    def _subfind_pieces(self, hpath, scale, sf_dest):
+        for part, start, (tf_values,) in self._chunks(self.sfbase, (hpath,)):
+            if scale is not None:
+                tf_values *= scale
+            dests = sf_dest[start: start + len(tf_values)]
+            found = dests >= 0
+            yield dests[found], tf_values[found]
+        return
+
+    def _join_subfindtables(self):
+        # sf_rows, and the row of the tree node of each subfind entry
+        # (sf_dest): subfind node indices are distributed into buckets by
+        # the chunk of rows of the tree columns holding them, and joined a
+        # chunk at a time
+        ids = self._columns["ids"]
+        chunk_rows = self._store.chunk_rows
+        nrows = len(ids)
+        bounds = np.array(
+            [ids[start] for start in range(chunk_rows, nrows, chunk_rows)],
+            dtype=ids.dtype,
+        )
+        hpath = "/Subhalo/nodeIndex"
+        nsub = sum(hdf5_sizes(self.fpath, self.sfbase, hpath))
+        with _Buckets(self._store._path("sf_dest") + ".buckets") as buckets:
+            with self._stage("distribute subfind node indices") as stage:
+                for part, start, (tf_ids,) in self._chunks(
+                    self.sfbase, (hpath,)
+                ):
+                    buckets.add(
+                        np.searchsorted(bounds, tf_ids, side="right"),
+                        ids=tf_ids,
+                        positions=np.arange(start, start + len(tf_ids)),
+                    )
+                stage.record(rows=nsub)
+            nmissing = []
+            with self._stage("join subfind tables") as stage:
+                self._store.save_scattered(
+                    "sf_dest",
+                    nsub,
+                    self._join_buckets(buckets, nmissing),
+                )
+                stage.record(rows=nsub)
+        if sum(nmissing) > 0:
+            logger.warning(
+                "TreeTables: %d nodes missing from subfind tables.",
+                sum(nmissing),
             )
-            SF.load(keys=("sgns", "cops", "vcents", "msubfind", ))
-            tf_sgns = SF.sgns
-            tf_cops = SF.cops
-            tf_vels = SF.vcents
-            tf_masstypes = SF.msubfind
-            this_sn = np.logical_and(self.sns == sn, self.in_tab)
-            for tree_id, tree_tabpos in zip(
-                self.tree_ids[this_sn], self.tree_tabposs[this_sn]
-            ):
-                self.sgns[tree_id] = tf_sgns[tree_tabpos].value
-                self.cops[tree_id] = tf_cops[tree_tabpos].value
-                self.vels[tree_id] = tf_vels[tree_tabpos].value
-                self.masstypes[tree_id] = tf_masstypes[tree_tabpos]
-            del SF["sgns"], SF["cops"], SF["vcents"], SF["msubfind"]
-            del SF
+        self._columns["sf_rows"] = self._store["sf_rows"]
         return
 
-    def _read_subfindtables(self):
-        _log("TreeTables: reading subfind tables:")
-        _log("  nodeIndex")
-        self.tf_tree_ids = hdf5_get(
-            self.fpath, self.sfbase, "/Subhalo/nodeIndex", ncpu=self.ncpu
+    def _join_buckets(self, buckets, nmissing):
+        # join the subfind node indices a chunk of tree rows at a time,
+        # saving sf_rows in order, and yield the subfind and tree rows of the
+        # nodes matched; appends the number of nodes without a match in each
+        # chunk to nmissing
+        ids = self._columns["ids"]
+        in_tab = self._columns["in_tab"]
+        chunk_rows = self._store.chunk_rows
+        nrows = len(ids)
+        with self._store._writer("sf_rows", nrows, np.int64) as write:
+            for b, start in enumerate(range(0, nrows, chunk_rows)):
+                stop = min(start + chunk_rows, nrows)
+                tree_rows, sf_rows = join_ids(
+                    ids[start:stop], buckets.get(b, "ids")
+                )
+                chunk_in_tab = in_tab[start:stop]
+                matched = chunk_in_tab[tree_rows]
+                tree_rows = tree_rows[matched]
+                sf_rows = buckets.get(b, "positions")[sf_rows[matched]]
+                rows = np.full(stop - start, -1, dtype=np.int64)
+                rows[tree_rows] = sf_rows
+                write(rows)
+                nmissing.append(
+                    np.count_nonzero(chunk_in_tab) - len(tree_rows)
+                )
+                yield sf_rows, start + tree_rows
+        return
+
+    def _restrict(self, fbase, positions):
+        # read only intervals covering positions from the files with base
+        # name fbase, returning the positions within the intervals read
+        unique = np.unique(positions)
+        if len(unique) == 0:
+            unique = np.zeros(1, dtype=np.int64)
+        intervals = _intervals(unique, _max_intervals)
+        self._intervals[fbase] = intervals
+        starts, ends = np.array(intervals).T
+        offsets = np.cumsum(ends - starts) - (ends - starts)
+        i = np.searchsorted(starts, positions, side="right") - 1
+        return offsets[i] + positions - starts[i]
+
+    def _gather(self, name, tf_values):
+        # pick the rows of a subfind table belonging to the tree nodes
+        sf_rows = self._columns["sf_rows"]
+        found = sf_rows >= 0
+        values = self._empty(tf_values)
+        values[found] = tf_values[sf_rows[found]]
+        return values
+
+    def _empty(self, values):
+        # padded full column with the dtype and row shape of values
+        fill, dtype = _padding(values.dtype)
+        return np.full(
+            (len(self._columns["ids"]),) + values.shape[1:], fill, dtype=dtype
         )
-        _log("  SubGroupNumber")
-        self.tf_sgns = hdf5_get(
-            self.fpath, self.sfbase, "/Subhalo/SubGroupNumber", ncpu=self.ncpu
+
+    @property
+    def sub_groups(self):
+        return self._map(("sns", "gns", "sgns"), sub=True)
+
+    @property
+    def sub_cops(self):
+        return self._map(("cops",), sub=True)
+
+    @property
+    def sub_vels(self):
+        return self._map(("vels",), sub=True)
+
+    @property
+    def sub_masstypes(self):
+        return self._map(("masstypes",), sub=True)
+
+    @property
+    def tree_descid(self):
+        return self._map(("descids",))
+
+    @property
+    def tree_mbpc(self):
+        return self._map(("mbpcs",))
+
+    @property
+    def sub_groups_r(self):
+        return _GroupMap(
+            self._columns["ids"],
+            self._derive("groups"),
+            self._derive("group_rows"),
+            # the on-disk index covers all rows, whatever the filter
+            visible=None if self._store is None else self._mask,
         )
-        _log("  CentreOfPotential")
-        # Comoving!
-        self.tf_cops = hdf5_get(
-            self.fpath,
-            self.sfbase,
-            "/Subhalo/CentreOfPotential",
-            ncpu=self.ncpu,
-        ) / h * U.Mpc
-        _log("  Velocity")
-        self.tf_vels = hdf5_get(
-            self.fpath, self.sfbase, "/Subhalo/Velocity", ncpu=self.ncpu
-        ) * U.km / U.s
-        _log("  MassType")
-        self.tf_masstypes = (
-            hdf5_get(
-                self.fpath, self.sfbase, "/Subhalo/MassType", ncpu=self.ncpu
+
+    def _map(self, names, sub=False):
+        columns = tuple(self._column(name) for name in names)
+        unit = self._unit(names[0]) if len(names) == 1 else None
+        if self._store is not None:
+            # flag visible rows rather than listing them
+            return _ColumnMap(
+                self._columns["ids"],
+                columns,
+                unit=unit,
+                visible=self._visible(sub),
             )
-            * 1e10
-            / h
-            * U.Msun
+        prefix = "sub_" if sub else ""
+        return _ColumnMap(
+            self._columns["ids"],
+            columns,
+            rows=self._derive(prefix + "rows"),
+            keys=self._derive(prefix + "keys"),
+            unit=unit,
         )
+
+    def _visible(self, sub):
+        # rows visible through the filter (with subfind entries if sub), as
+        # a mask or None for all rows
+        if not sub:
+            return self._mask
+        if self._mask is None:
+            return self._columns["in_tab"]
+        if "sub_visible" not in self._index:
+            self._index["sub_visible"] = np.logical_and(
+                self._mask, self._columns["in_tab"]
+            )
+        return self._index["sub_visible"]
+
+    def _unit(self, name):
+        # astropy unit of a column, or None if it is returned without units
+        if not self.units or self._units.get(name) is None:
+            return None
+        return _unit(self._units[name])
+
+    def _derive(self, name):
+        if name not in self._index:
+            getattr(self, self._derived[name])()
+        return self._index[name]
+
+    def _index_rows(self):
+        # rows visible through the current filter, and the subset of those
+        # with subfind entries
+        if self._mask is None:
+            self._index["rows"] = None
+            self._index["keys"] = None
+            sub_rows = np.flatnonzero(self._columns["in_tab"])
+        else:
+            self._index["rows"] = np.flatnonzero(self._mask)
+            self._index["keys"] = self._columns["ids"][self._index["rows"]]
+            sub_rows = np.flatnonzero(
+                np.logical_and(self._mask, self._columns["in_tab"])
+            )
+        self._index["sub_rows"] = sub_rows
+        self._index["sub_keys"] = self._columns["ids"][sub_rows]
         return
 
-    def _sort_tables(self):
-        _log(
-            "TreeTables: sorting "
-            + {True: "snapshot", False: "subfind"}[self.use_snapshots]
-            + " tables."
-        )
-        if not self.use_snapshots:
-            mask = np.isin(self.tf_tree_ids, self.tree_ids[self.in_tab])
-            self.sgns = self.tf_sgns[mask]
-            self.cops = self.tf_cops[mask]
-            self.vels = self.tf_vels[mask]
-            self.masstypes = self.tf_masstypes[mask]
+    def _index_progenitors(self):
+        if self._store is None:
+            self._progenitor_index(self._derive("rows"))
         else:
-            keylist = self.tree_ids[self.in_tab]
-            self.sgns = np.array([self.sgns[key] for key in keylist])
-            self.cops = np.array([self.cops[key] for key in keylist])
-            self.vels = np.array([self.vels[key] for key in keylist])
-            self.masstypes = U.Quantity(
-                [self.masstypes[key] for key in keylist]
+            # kept on disk, over all rows; _progenitors applies the filter
+            self._from_store(
+                ("prog_descids", "prog_rows"), self._store_progenitor_index
             )
-        self.sub_groups = dict(
-            zip(
-                self.tree_ids[self.in_tab],
-                np.vstack(
-                    (self.sns[self.in_tab], self.gns[self.in_tab], self.sgns)
-                ).T,
+        return
+
+    def _progenitor_index(self, rows):
+        # rows sorted by descendant, then by increasing mbpc
+        descids = np.asarray(self._columns["descids"])
+        mbpcs = np.asarray(self._columns["mbpcs"])
+        if rows is not None:
+            descids, mbpcs = descids[rows], mbpcs[rows]
+        with self._stage("index progenitors") as stage:
+            order = np.lexsort((mbpcs, descids))
+            stage.record(rows=len(order))
+        self._index["prog_descids"] = descids[order]
+        self._index["prog_rows"] = order if rows is None else rows[order]
+        return
+
+    def _store_progenitor_index(self):
+        # _progenitor_index over all rows, sorted out of core
+        names = ("descids", "mbpcs")
+        dtype = [(name, self._columns[name].dtype) for name in names]
+
+        def pieces():
+            for rows, columns in self._store_chunks(names):
+                keys = np.empty(len(rows), dtype=dtype)
+                for name, column in zip(names, columns):
+                    keys[name] = column
+                yield keys, rows
+
+        with self._stage("index progenitors") as stage:
+            self._sort_index(("prog_descids", "prog_rows"), pieces, "descids")
+            stage.record(rows=len(self._columns["ids"]))
+        return
+
+    def _from_store(self, names, build):
+        # open derived indices kept in the store, first building them over
+        # all rows into the store if needed
+        if any(name not in self._store for name in names):
+            build()
+        for name in names:
+            self._index[name] = self._store[name]
+        return
+
+    def _store_chunks(self, names):
+        # (rows, values of columns) for chunks of rows of the store
+        nrows = len(self._columns["ids"])
+        chunk_rows = self._store.chunk_rows
+        for start in range(0, nrows, chunk_rows):
+            stop = min(start + chunk_rows, nrows)
+            yield np.arange(start, stop), [
+                self._columns[name][start:stop] for name in names
+            ]
+        return
+
+    def _sort_index(self, names, pieces, field=None):
+        # save a derived index sorted by key, and the rows of its keys, to
+        # the store under names, for the (keys, rows) chunks yielded by
+        # pieces(), keys being structured arrays sorted field by field:
+        # sampled keys give the bounds of buckets small enough to sort in
+        # memory, and the keys (or only their field given) and rows are
+        # saved a bucket at a time
+        keys_name, rows_name = names
+        nrows = len(self._columns["ids"])
+        nbuckets = max(-(-2 * nrows // self._store.chunk_rows), 1)
+        step = max(nrows // (256 * nbuckets), 1)
+        # copies, as views would keep every chunk in memory
+        sample = np.sort(
+            np.concatenate([keys[::step].copy() for keys, rows in pieces()])
+        )
+        nbuckets = min(nbuckets, max(len(sample), 1))
+        bounds = sample[len(sample) * np.arange(1, nbuckets) // nbuckets]
+        dtype = sample.dtype if field is None else sample.dtype[field]
+        with _Buckets(self._store._path(keys_name) + ".buckets") as buckets:
+            count = 0
+            for keys, rows in pieces():
+                buckets.add(
+                    np.searchsorted(bounds, keys, side="right"),
+                    keys=keys,
+                    rows=rows,
+                )
+                count += len(rows)
+            keys_writer = self._store._writer(keys_name, count, dtype)
+            rows_writer = self._store._writer(rows_name, count, np.int64)
+            with keys_writer as write_keys, rows_writer as write_rows:
+                for b in range(nbuckets):
+                    keys = buckets.get(b, "keys")
+                    order = np.lexsort(
+                        [keys[name] for name in keys.dtype.names[::-1]]
+                    )
+                    keys = keys[order]
+                    write_keys(keys if field is None else keys[field])
+                    write_rows(buckets.get(b, "rows")[order])
+        return
+
+    def _index_descendants(self):
+        if self._store is None:
+            self._index["desc_rows"] = _descendant_rows(
+                np.asarray(self._columns["ids"]),
+                np.asarray(self._columns["descids"]),
+                rows=self._derive("rows"),
             )
+            return
+        # kept on disk, over all rows, and read in with the filter applied:
+        # rows hidden, or whose descendant is hidden, have none
+        if "desc_rows" not in self._store:
+            self._store_descendant_rows()
+        pieces = []
+        for start, desc_rows in self._store["desc_rows"].blocks():
+            if self._mask is not None:
+                visible = self._mask[start: start + len(desc_rows)]
+                visible = visible & self._mask[desc_rows] & (desc_rows >= 0)
+                desc_rows = np.where(visible, desc_rows, -1)
+            pieces.append(desc_rows)
+        self._index["desc_rows"] = np.concatenate(
+            [np.empty(0, dtype=np.int64)] + pieces
         )
-        self.sub_cops = dict(
-            zip(self.tree_ids[self.in_tab], self.cops)
+        return
+
+    def _store_descendant_rows(self):
+        # _descendant_rows over all rows, out of core: descendant node
+        # indices are distributed into buckets by the chunk of rows of the
+        # tree columns holding them, and joined a chunk at a time, as in
+        # _join_subfindtables
+        ids = self._columns["ids"]
+        chunk_rows = self._store.chunk_rows
+        nrows = len(ids)
+        bounds = np.array(
+            [ids[start] for start in range(chunk_rows, nrows, chunk_rows)],
+            dtype=ids.dtype,
         )
-        self.sub_vels = dict(
-            zip(self.tree_ids[self.in_tab], self.vels)
+        with _Buckets(self._store._path("desc_rows") + ".buckets") as buckets:
+            with self._stage("index descendants") as stage:
+                for rows, (chunk_ids, descids) in self._store_chunks(
+                    ("ids", "descids")
+                ):
+                    other = descids != chunk_ids
+                    buckets.add(
+                        np.searchsorted(bounds, descids[other], side="right"),
+                        descids=descids[other],
+                        rows=rows[other],
+                    )
+                self._store.save_scattered(
+                    "desc_rows", nrows, self._descendant_buckets(buckets)
+                )
+                stage.record(rows=nrows)
+        return
+
+    def _descendant_buckets(self, buckets):
+        # join the descendant node indices a chunk of tree rows at a time,
+        # and yield the rows and descendant rows of the nodes matched
+        ids = self._columns["ids"]
+        chunk_rows = self._store.chunk_rows
+        nrows = len(ids)
+        for b, start in enumerate(range(0, nrows, chunk_rows)):
+            stop = min(start + chunk_rows, nrows)
+            rows, desc_rows = join_ids(
+                buckets.get(b, "descids"), ids[start:stop]
+            )
+            yield buckets.get(b, "rows")[rows], start + desc_rows
+        return
+
+    def _progenitors(self, key):
+        # keys of the progenitors of key, by decreasing mbpc
+        descids = self._derive("prog_descids")
+        lo = descids.searchsorted(key, side="left")
+        hi = descids.searchsorted(key, side="right")
+        rows = self._derive("prog_rows")[lo:hi][::-1]
+        if self._store is not None and self._mask is not None:
+            rows = rows[self._mask[rows]]
+        keys = self._columns["ids"][rows]
+        return keys[keys != key]
+
+    def _progenitor_pairs(self):
+        # progenitor index in memory, restricted to visible progenitors
+        descids = self._derive("prog_descids")
+        rows = self._derive("prog_rows")
+        if self._store is not None:
+            descids, rows = np.asarray(descids), np.asarray(rows)
+            if self._mask is not None:
+                visible = self._mask[rows]
+                descids, rows = descids[visible], rows[visible]
+        return descids, rows
+
+    def _index_main(self):
+        self._index["main_rows"] = _main_progenitor_rows(
+            np.asarray(self._columns["ids"]), *self._progenitor_pairs()
         )
-        self.sub_masstypes = dict(
-            zip(self.tree_ids[self.in_tab], self.masstypes)
+        return
+
+    def _index_children(self):
+        offsets, rows = _children(
+            np.asarray(self._columns["ids"]), *self._progenitor_pairs()
         )
+        self._index["child_offsets"] = offsets
+        self._index["child_rows"] = rows
+        return
 
-        self.tree_descid = dict(zip(self.tree_ids, self.tree_descids))
-        self.tree_mbpc = dict(zip(self.tree_ids, self.tree_mbpcs))
+    def _index_final(self):
+        desc_rows = self._derive("desc_rows")
+        rows = np.arange(len(desc_rows))
+        with self._stage("index final descendants") as stage:
+            self._index["final_rows"] = _jump(
+                np.where(desc_rows >= 0, desc_rows, rows)
+            )
+            stage.record(rows=len(rows))
+        return
 
+    def _index_branch_ends(self):
+        # last row of the main branch each row is on, following descendants
+        # while the row is their main progenitor
+        desc_rows = self._derive("desc_rows")
+        main_rows = self._derive("main_rows")
+        rows = np.arange(len(desc_rows))
+        main = desc_rows >= 0
+        main[main] = main_rows[desc_rows[main]] == rows[main]
+        with self._stage("index branch ends") as stage:
+            self._index["branch_ends"] = _jump(
+                np.where(main, desc_rows, rows)
+            )
+            stage.record(rows=len(rows))
         return
 
-    def _filter(self, include):
-        _log("TreeTables: applying mask.")
-        # kill dict items with keys not in include
-        self.sub_groups = {k: self.sub_groups[k] for k in include}
-        self.sub_cops = {k: self.sub_cops[k] for k in include}
-        self.sub_vels = {k: self.sub_vels[k] for k in include}
-        self.sub_masstypes = {k: self.sub_masstypes[k] for k in include}
-        self.tree_descid = {k: self.tree_descid[k] for k in include}
-        self.tree_mbpc = {k: self.tree_mbpc[k] for k in include}
-        self._reverse()
+    def _index_interpolation(self):
+        # interpolated nodes, with the rows of their nearest progenitor and
+        # descendant along the branch that have subfind entries (-1 if none)
+        in_tab = np.asarray(self._columns["in_tab"])
+        rows = np.arange(len(in_tab))
+        with self._stage("index interpolated nodes") as stage:
+            interp_rows = np.flatnonzero(~in_tab)
+            for name, pointers in (
+                ("interp_progs", self._derive("main_rows")),
+                ("interp_descs", self._derive("desc_rows")),
+            ):
+                ends = _jump(
+                    np.where(~in_tab & (pointers >= 0), pointers, rows)
+                )[interp_rows]
+                self._index[name] = np.where(in_tab[ends], ends, -1)
+            self._index["interp_rows"] = interp_rows
+            stage.record(rows=len(interp_rows))
+        return
+
+    # columns filled in for interpolated nodes, if interpolate is set
+    _interpolated = ("cops", "vels", "masstypes")
+
+    def _take(self, name, rows):
+        # values of a column for rows, those of interpolated nodes linearly
+        # interpolated in snapshot number between their nearest progenitor
+        # and descendant with subfind entries, if interpolate is set
+        values = self._column(name)[rows]
+        if not self.interpolate or name not in self._interpolated:
+            return values
+        interp_rows = self._derive("interp_rows")
+        if len(interp_rows) == 0:
+            return values
+        i = np.minimum(interp_rows.searchsorted(rows), len(interp_rows) - 1)
+        fill = np.flatnonzero(interp_rows[i] == rows)
+        progs = self._derive("interp_progs")[i[fill]]
+        descs = self._derive("interp_descs")[i[fill]]
+        known = (progs >= 0) & (descs >= 0)
+        fill, progs, descs = fill[known], progs[known], descs[known]
+        if len(fill) == 0:
+            return values
+        sn, sn0, sn1 = (
+            np.asarray(self._columns["sns"][r], dtype=float)
+            for r in (rows[fill], progs, descs)
+        )
+        t = (sn - sn0) / (sn1 - sn0)
+        t = t.reshape(t.shape + (1,) * (values.ndim - 1))
+        column = self._column(name)
+        start, end = column[progs], column[descs]
+        step = end - start
+        if name == "cops" and self.boxsize is not None:
+            # the shorter way round the periodic box
+            boxsize = self._value("cops", self.boxsize)
+            step = step - boxsize * np.round(step / boxsize)
+            values[fill] = np.mod(start + t * step, boxsize)
+        else:
+            values[fill] = start + t * step
+        return values
+
+    def _rows(self, keys):
+        # rows of visible nodes
+        keys = np.asarray(keys)
+        rows = np.asarray(self._columns["ids"].searchsorted(keys))
+        found = rows < len(self._columns["ids"])
+        found[found] = self._columns["ids"][rows[found]] == keys[found]
+        if self._mask is not None:
+            found[found] = self._mask[rows[found]]
+        if not np.all(found):
+            raise KeyError(keys[~found].tolist())
+        return rows
+
+    def _field(self, field):
+        if field not in self._columns and field not in self._subfind_columns:
+            raise ValueError(
+                "TreeTables: unknown field '{0:s}'.".format(field)
+            )
+        return self._column(field)
+
+    def _values(self, keys, field):
+        # values of a column for nodes, with units (unless units=False)
+        self._field(field)
+        values = self._take(field, self._rows(keys))
+        unit = self._unit(field)
+        return values if unit is None else values * unit
+
+    def _branches(self, keys):
+        # rows along the main branches of nodes, one branch per row of the
+        # result, padded with -1
+        return _main_branches(
+            self._rows(np.atleast_1d(keys)), self._derive("main_rows")
+        )
+
+    def history(self, keys, field, ragged=False):
+        """
+        Values of a column along the main branches of many nodes.
+
+        A main branch runs from a node back through its main progenitors
+        (those contributing the most bound particles). The branches are
+        traced for all the nodes at once, and the values read in one go.
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys, e.g. of roots.
+
+        field: str
+            Column name: 'masstypes', 'cops', 'vels', 'sgns', 'sns', 'gns',
+            'descids', 'mbpcs' or 'ids'.
+
+        ragged: bool
+            Return the values for each branch separately, rather than a
+            padded array.
+
+        Returns
+        -------
+        out : ndarray or Quantity, or tuple of lists
+            Array of shape (len(keys), number of snapshots) (plus the shape
+            of the field values) with the value at each snapshot, padded
+            with NaN (or -1) at snapshots without a node or a subfind entry;
+            or if ragged, lists of the snapshot numbers and of the values
+            along each branch, from the node back.
+        """
+
+        self._field(field)
+        branches = self._branches(keys)
+        present = branches >= 0
+        rows = branches[present]
+        values = self._take(field, rows)
+        sns = np.asarray(self._columns["sns"][rows])
+        unit = self._unit(field)
+        if ragged:
+            stops = np.cumsum(np.sum(present, axis=1))
+            starts = stops - np.sum(present, axis=1)
+            pieces = [slice(*bounds) for bounds in zip(starts, stops)]
+            if unit is not None:
+                values = values * unit
+            return [sns[p] for p in pieces], [values[p] for p in pieces]
+        nsnap = int(
+            np.max(self._blockwise("sns", lambda sns: sns.max(keepdims=True)))
+        )
+        fill, dtype = _padding(values.dtype)
+        out = np.full(
+            (len(branches), nsnap + 1) + values.shape[1:], fill, dtype=dtype
+        )
+        out[np.nonzero(present)[0], sns] = values
+        return out if unit is None else out * unit
+
+    def formation(self, keys, particle_type=1, fraction=0.5):
+        """
+        Formation times and peak masses of many nodes.
+
+        Computed along the main branches of the nodes (see history()), for
+        the mass of a given particle type (0:gas, 1:DM, 2:boundary,
+        3:boundary, 4:star, 5:BH).
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys, e.g. of roots.
+
+        particle_type: int
+            Particle type whose mass is used.
+
+        fraction: float
+            Fraction of the mass of the node defining its formation.
+
+        Returns
+        -------
+        out : dict
+            Arrays aligned with keys: 'formation_snapshot' (earliest
+            snapshot before which the main branch has less than fraction of
+            the mass of the node), 'peak_mass' (largest mass along the main
+            branch, NaN if none is known) and 'peak_snapshot' (snapshot of
+            the peak mass, -1 if none is known).
+        """
+
+        branches = self._branches(keys)
+        present = branches >= 0
+        rows = branches[present]
+        masses = np.full(branches.shape, np.nan)
+        masses[present] = self._take("masstypes", rows)[:, particle_type]
+        sns = np.full(branches.shape, -1, dtype=np.int64)
+        sns[present] = self._columns["sns"][rows]
+        index = np.arange(len(branches))
+        # NaN, at snapshots without a subfind entry, never counts as a drop
+        below = masses < fraction * masses[:, :1]
+        formed = np.where(
+            np.any(below, axis=1),
+            np.argmax(below, axis=1) - 1,
+            np.sum(present, axis=1) - 1,
+        )
+        formation_snapshot = np.where(
+            np.isnan(masses[:, 0]), -1, sns[index, formed]
+        )
+        peaks = np.argmax(np.where(np.isnan(masses), -np.inf, masses), axis=1)
+        peak_mass = masses[index, peaks]
+        peak_snapshot = np.where(np.isnan(peak_mass), -1, sns[index, peaks])
+        unit = self._unit("masstypes")
+        return {
+            "formation_snapshot": formation_snapshot,
+            "peak_mass": peak_mass if unit is None else peak_mass * unit,
+            "peak_snapshot": peak_snapshot,
+        }
+
+    def final_descendant(self, keys):
+        """
+        Final descendants of many nodes.
+
+        Descendants are followed to the end of the tree, e.g. to the root at
+        the last snapshot, for all the nodes at once. With a filter applied,
+        the chain stops at the last visible descendant.
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys.
+
+        Returns
+        -------
+        out : ndarray
+            Key of the final descendant of each node (the node itself if it
+            has no descendant).
+        """
+
+        final_rows = self._derive("final_rows")
+        return np.asarray(
+            self._columns["ids"][final_rows[self._rows(np.atleast_1d(keys))]]
+        )
+
+    def merge_snapshot(self, keys):
+        """
+        Snapshots at which the branches of many nodes merge.
+
+        A node's branch continues through its descendants for as long as it
+        is their main progenitor (the one contributing the most bound
+        particles); it merges into the first descendant of which it is not
+        the main progenitor.
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys.
+
+        Returns
+        -------
+        out : ndarray
+            Snapshot of the descendant into which the branch of each node
+            merges, or -1 if the branch survives to the end of the tree.
+        """
+
+        desc_rows = self._derive("desc_rows")
+        ends = self._derive("branch_ends")[self._rows(np.atleast_1d(keys))]
+        merged = desc_rows[ends]
+        sns = np.asarray(self._columns["sns"][np.maximum(merged, 0)])
+        return np.where(merged >= 0, sns, -1)
+
+    def subtree(self, key):
+        """
+        Keys of all the nodes of the subtree rooted at a node.
+
+        A lightweight alternative to building a Tree: the subtree is walked
+        one level at a time over index arrays (with compiled kernels if
+        numba is installed).
+
+        Parameters
+        ----------
+        key: int
+            Node key.
+
+        Returns
+        -------
+        out : ndarray
+            Keys of the node and of all its progenitors, recursively, level
+            by level, as the nodes of a Tree grown from the node.
+        """
+
+        offsets = self._derive("child_offsets")
+        children = self._derive("child_rows")
+        levels = [self._rows([key])]
+        while len(levels[-1]) > 0:
+            levels.append(_gather(offsets, children, levels[-1]))
+        return np.asarray(self._columns["ids"][np.concatenate(levels)])
+
+    def subtree_size(self, keys):
+        """
+        Numbers of nodes in the subtrees rooted at many nodes.
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys.
+
+        Returns
+        -------
+        out : ndarray
+            Number of nodes in the subtree of each node, including itself.
+        """
+
+        return self._subtree_sum(
+            keys, np.ones(len(self._columns["ids"]), dtype=np.int64)
+        )
+
+    def subtree_mass(self, keys, particle_type=1):
+        """
+        Total masses of the nodes in the subtrees rooted at many nodes.
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys.
+
+        particle_type: int
+            Particle type whose mass is summed (0:gas, 1:DM, 2:boundary,
+            3:boundary, 4:star, 5:BH); nodes without a subfind entry count
+            for nothing.
+
+        Returns
+        -------
+        out : ndarray or Quantity
+            Sum of the masses of the node and of all its progenitors,
+            recursively.
+        """
+
+        masses = np.concatenate(
+            [
+                block[:, particle_type].astype(np.float64)
+                for start, block in _pieces(self._column("masstypes"))
+            ]
+        )
+        if self._mask is not None:
+            masses[~self._mask] = 0
+        sums = self._subtree_sum(keys, np.nan_to_num(masses))
+        unit = self._unit("masstypes")
+        return sums if unit is None else sums * unit
+
+    def _subtree_sum(self, keys, values):
+        sums = _subtree_sums(
+            self._derive("desc_rows"), np.asarray(self._columns["sns"]), values
+        )
+        return sums[self._rows(np.atleast_1d(keys))]
+
+    def depth(self, keys):
+        """
+        Depths of many nodes in their trees.
+
+        Parameters
+        ----------
+        keys: array_like
+            Node keys.
+
+        Returns
+        -------
+        out : ndarray
+            Number of descendants between each node and its final
+            descendant (see final_descendant()), counting the latter.
+        """
+
+        depths = _depths(
+            self._derive("desc_rows"), np.asarray(self._columns["sns"])
+        )
+        return depths[self._rows(np.atleast_1d(keys))]
+
+    def mergers(self):
+        """
+        Catalogue of every merger in the forest.
+
+        A merger is recorded for each progenitor of a node other than its
+        main progenitor (the one contributing the most bound particles).
+        Filters applied to the TreeTables apply to descendants and
+        progenitors alike.
+
+        Returns
+        -------
+        out : dict
+            Arrays with a row per merger: 'descendant', 'main' and
+            'progenitor' (node keys), 'snapshot' (of the descendant),
+            'mass_ratios' (masses of the progenitor over those of the main
+            progenitor, for each particle type; NaN where not defined),
+            'main_mbpcs' and 'mbpcs' (most bound particles contributed to
+            the descendant by the main and the other progenitor).
+        """
+
+        ids = np.asarray(self._columns["ids"])
+        with self._stage("find mergers") as stage:
+            desc_rows, main_rows, rows = _mergers(
+                ids, *self._progenitor_pairs()
+            )
+            if self._mask is not None:
+                visible = self._mask[desc_rows]
+                desc_rows = desc_rows[visible]
+                main_rows, rows = main_rows[visible], rows[visible]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mass_ratios = self._take("masstypes", rows) / self._take(
+                    "masstypes", main_rows
+                )
+            stage.record(rows=len(rows))
+        return {
+            "descendant": ids[desc_rows],
+            "main": ids[main_rows],
+            "progenitor": ids[rows],
+            "snapshot": np.asarray(self._columns["sns"][desc_rows]),
+            "mass_ratios": mass_ratios,
+            "main_mbpcs": np.asarray(self._columns["mbpcs"][main_rows]),
+            "mbpcs": np.asarray(self._columns["mbpcs"][rows]),
+        }
+
+    def build_trees_parallel(self, groups, ncpu=None, reduce=None):
+        """
+        Construct the Trees rooted at many groups using a pool of processes.
+
+        Roots are distributed so that the expected number of nodes to grow is
+        balanced between the processes. Consider calling share() first so
+        that the processes do not each receive a copy of the tables.
+
+        Parameters
+        ----------
+        groups: iterable
+            Root groups, as (snapshot, fof, subgroup) tuples.
+
+        ncpu: int
+            Number of processes (default: None -> the TreeTables ncpu setting,
+            0 -> all cpus).
+
+        reduce: callable
+            Function applied to each Tree in the worker processes, whose
+            return value replaces the Tree in the output (optional).
+
+        Returns
+        -------
+        out : list
+            Trees, or reduce results, in the order of groups.
+        """
+
+        groups = [tuple(group) for group in groups]
+        ncpu = self.ncpu if ncpu is None else ncpu
+        ncpu = multiprocessing.cpu_count() - 1 if ncpu == 0 else ncpu
+        ncpu = max(min(ncpu, len(groups)), 1)
+        logger.info(
+            "TreeTables: building %d trees on %d processes.", len(groups), ncpu
+        )
+        sub_groups_r = self.sub_groups_r
+        keys = np.array([sub_groups_r[group] for group in groups])
+        sizes = _subtree_sums(
+            self._derive("desc_rows"),
+            np.asarray(self._columns["sns"]),
+            np.ones(len(self._columns["ids"]), dtype=np.int64),
+        )
+        sizes = sizes[self._columns["ids"].searchsorted(keys)]
+        batches = [
+            [(i, groups[i]) for i in batch]
+            for batch in _balance(sizes, ncpu)
+        ]
+        if ncpu == 1:
+            _pool_init(self)
+            done = [_pool_build(batch, reduce) for batch in batches]
+            _pool_init(None)
+        else:
+            with multiprocessing.Pool(
+                ncpu, initializer=_pool_init, initargs=(self,)
+            ) as pool:
+                done = pool.starmap(
+                    _pool_build, [(batch, reduce) for batch in batches]
+                )
+        results = [None] * len(groups)
+        for i, result in (item for batch in done for item in batch):
+            if reduce is None:
+                result = Tree._unflatten(*result, treetables=self)
+            results[i] = result
+        return results
+
+    def _filter(self, mask):
+        # hide rows where mask is False
+        mask = np.asarray(mask)
+        if mask.dtype != bool or mask.shape != (len(self._columns["ids"]),):
+            raise ValueError(
+                "TreeTables: filters are boolean masks over the rows of the "
+                "tables."
+            )
+        if self._mask is not None:
+            mask = np.logical_and(mask, self._mask)
+        self._mask = mask
+        self._index = dict()
         return
 
     def _reverse(self):
-        _log('TreeTables: calculating "reversed" dicts.')
-        # construct reverse dict so that new root nodes can obtain their key
+        if self._store is None:
+            self._group_index(self._derive("sub_rows"))
+        else:
+            # kept on disk, over all rows; sub_groups_r applies the filter
+            self._from_store(
+                ("groups", "group_rows"), self._store_group_index
+            )
+        return
+
+    def _group_index(self, rows):
+        # construct reverse index so that new root nodes can obtain their key
         # from group
-        self.sub_groups_r = {
-            tuple(value): key
-            for key, value in self.sub_groups.items()
-            if key // self.phantom == 0
-        }
+        rows = rows[self._columns["ids"][rows] // self.phantom == 0]
+        names = ("sns", "gns", "sgns")
+        columns = [self._column(name)[rows] for name in names]
+        dtype = [(name, column.dtype) for name, column in zip(names, columns)]
+        groups = np.empty(len(rows), dtype=dtype)
+        for name, column in zip(names, columns):
+            groups[name] = column
+        with self._stage("reverse index") as stage:
+            order = np.lexsort(columns[::-1])
+            stage.record(rows=len(order))
+        self._index["groups"] = groups[order]
+        self._index["group_rows"] = rows[order]
         return
 
+    def _store_group_index(self):
+        # _group_index over all rows, sorted out of core
+        names = ("sns", "gns", "sgns")
+        dtype = [(name, self._column(name).dtype) for name in names]
+
+        def pieces():
+            for rows, (ids, in_tab, *columns) in self._store_chunks(
+                ("ids", "in_tab") + names
+            ):
+                keep = np.logical_and(in_tab, ids // self.phantom == 0)
+                groups = np.empty(np.count_nonzero(keep), dtype=dtype)
+                for name, column in zip(names, columns):
+                    groups[name] = column[keep]
+                yield groups, rows[keep]
+
+        with self._stage("reverse index") as stage:
+            self._sort_index(("groups", "group_rows"), pieces)
+            stage.record(rows=len(self._columns["ids"]))
+        return
+
+    def share(self):
+        """
+        Move the tables into shared memory.
+
+        Afterwards, pickling this TreeTables (e.g. to send it to the workers of
+        a multiprocessing.Pool) transfers only a handle to the shared memory,
+        and unpickled copies attach to the same memory instead of copying the
+        data. The process that called share() should call release() once the
+        workers are done.
+
+        The indices used to grow trees are shared too, as built under the
+        current filter; copies pickled under a different filter (e.g. after
+        mass_filter() or from a view()) derive their own instead.
+
+        In out-of-core mode (see store) nothing is moved: pickled copies
+        already open the store themselves rather than copying the data.
+
+        Returns
+        -------
+        out : TreeTables
+            This TreeTables instance.
+        """
+
+        if self._shared is None and self._store is None:
+            with self._stage("share") as stage:
+                self._shared = (
+                    _SharedArrays(self._columns),
+                    _SharedArrays(
+                        {
+                            name: self._derive(name)
+                            for name in self._shared_indices
+                        }
+                    ),
+                )
+                self._shared_mask = self._mask
+                for column in self._columns.values():
+                    stage.record(nbytes=column.nbytes)
+            self._attach()
+        return self
+
+    def release(self):
+        """
+        Release the shared memory obtained with share().
+
+        In the process that called share() the memory is freed, other
+        processes only detach from it. The TreeTables is unusable afterwards.
+        """
+
+        if self._shared is not None:
+            self._columns = dict()
+            self._index = dict()
+            for shared in self._shared:
+                shared.close()
+            self._shared = None
+        return
+
+    def _attach(self):
+        columns, index = self._shared
+        self._columns = columns.arrays()
+        self._index = index.arrays()
+        return
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # derived indices are cheaper to re-compute than to transfer
+        state["_index"] = dict()
+        if self._shared is not None:
+            del state["_columns"]
+            # the shared indices hold only for the filter they were built
+            # under
+            state["_shared_index"] = self._mask is self._shared_mask
+        return state
+
+    def __setstate__(self, state):
+        shared_index = state.pop("_shared_index", False)
+        self.__dict__.update(state)
+        if self._shared is not None:
+            self._attach()
+            if shared_index:
+                self._shared_mask = self._mask
+            else:
+                self._index = dict()
+        return
+
+    def mass_mask(self, cut, particle_type=1):
+        """
+        Flag the halos above a mass cut for a mass of a given type.
+
+        Masks can be combined with the usual numpy operators (&, |, ~) and
+        passed to view() or apply_filter() of the same TreeTables.
+
+        Parameters
+        ----------
+        cut: float or Quantity
+            Mass cut, in Msun if given without units.
+
+        particle_type: int
+            Column of MassType to compare (0:gas, 1:DM, 2:boundary,
+            3:boundary, 4:star, 5:BH).
+
+        Returns
+        -------
+        out : ndarray
+            Boolean mask over the rows of the tables.
+        """
+
+        cut = self._value("masstypes", cut)
+        mask = self._blockwise(
+            "masstypes", lambda masstypes: masstypes[:, particle_type] > cut
+        )
+        return np.logical_and(mask, self._columns["in_tab"])
+
+    def _blockwise(self, name, func):
+        # func evaluated over a column, a block at a time in out-of-core mode
+        column = self._column(name)
+        if self._store is None:
+            return func(column)
+        return np.concatenate(
+            [func(block) for start, block in column.blocks()]
+        )
+
     def mass_filter(self, cut, particle_type=1):
-        _log("TreeTables: evaluating mass filter.")
         # include only halos above mass cut for a mass of a given type
-        # (0:gas, 1:DM, 2:boundary, 3:boundary, 4:star, 5:BH)
-        mask = U.Quantity(
-            list(self.sub_masstypes.values())
-        )[:, particle_type] > cut
-        include_keys = np.array(list(self.sub_masstypes.keys()))[mask]
-        self._filter(include_keys)
+        # (0:gas, 1:DM, 2:boundary, 3:boundary, 4:star, 5:BH), on top of
+        # any filter already applied; see also view(), apply_filter() and
+        # reset_filter()
+        if np.ndim(cut) > 0:
+            raise ValueError(
+                "TreeTables: mass_filter takes a single mass cut; use "
+                "apply_filter() to apply a mask."
+            )
+        self._filter(self.mass_mask(cut, particle_type=particle_type))
+        return
+
+    def apply_filter(self, mask):
+        """
+        Filter the tables in place.
+
+        As view(), but applied to this TreeTables: from then on Trees
+        include only the nodes passing the filter, on top of any filter
+        already applied. Undone by reset_filter().
+
+        Parameters
+        ----------
+        mask: ndarray
+            Boolean mask over the rows of the tables, e.g. from mass_mask()
+            or select(out='mask'), or a combination of such masks.
+        """
+
+        self._filter(mask)
         return
 
+    def select(
+        self,
+        snapshot=None,
+        fof=None,
+        subgroup=None,
+        mass=None,
+        box=None,
+        speed=None,
+        out="keys",
+    ):
+        """
+        Select nodes by their properties.
+
+        Each predicate is either a value (select equal values), a list or
+        array (select values in it), or a (min, max) tuple (select
+        min <= value < max, either bound may be None). Predicates on masses,
+        positions and speeds may carry units, otherwise they are taken to be
+        in the units of the tables (Msun, Mpc, km/s). All predicates given
+        must hold, and filters already applied to the TreeTables apply too.
+        Predicates on subgroup numbers, masses, positions or speeds select
+        only nodes with subfind entries.
+
+        Parameters
+        ----------
+        snapshot: predicate
+            Snapshot number.
+
+        fof: predicate
+            FoF group index.
+
+        subgroup: predicate
+            Subgroup number.
+
+        mass: dict
+            Predicates on the mass of the given particle types, as
+            {particle_type: predicate}.
+
+        box: tuple
+            Predicates on the x, y and z coordinates of the centre of
+            potential (None for no restriction on an axis).
+
+        speed: predicate
+            Magnitude of the velocity.
+
+        out: str
+            What to return: 'keys', 'view' or 'mask'.
+
+        Returns
+        -------
+        out : ndarray or TreeTables
+            Sorted node keys, a filtered view (see view()), or a boolean mask
+            over the rows of the tables (see mass_mask()).
+        """
+
+        if self._mask is None:
+            mask = np.ones(len(self._columns["ids"]), dtype=bool)
+        else:
+            mask = self._mask.copy()
+        for name, predicate in (
+            ("sns", snapshot),
+            ("gns", fof),
+            ("sgns", subgroup),
+        ):
+            if predicate is not None:
+                mask &= self._blockwise(
+                    name, lambda column: _match(column, predicate)
+                )
+        if mass is not None:
+            for particle_type, predicate in mass.items():
+                predicate = self._value("masstypes", predicate)
+                mask &= self._blockwise(
+                    "masstypes",
+                    lambda masstypes: _match(
+                        masstypes[:, particle_type], predicate
+                    ),
+                )
+        if box is not None:
+            for axis, predicate in enumerate(box):
+                if predicate is not None:
+                    predicate = self._value("cops", predicate)
+                    mask &= self._blockwise(
+                        "cops", lambda cops: _match(cops[:, axis], predicate)
+                    )
+        if speed is not None:
+            speed = self._value("vels", speed)
+            mask &= self._blockwise(
+                "vels",
+                lambda vels: _match(
+                    np.sqrt(np.sum(np.square(vels), axis=1)), speed
+                ),
+            )
+        if any(
+            predicate is not None for predicate in (subgroup, mass, box, speed)
+        ):
+            # the padding of nodes without a subfind entry never matches
+            mask &= self._blockwise("in_tab", lambda in_tab: in_tab)
+        if out == "keys":
+            return self._columns["ids"][mask]
+        elif out == "view":
+            return self.view(mask)
+        elif out == "mask":
+            return mask
+        else:
+            raise ValueError(
+                "TreeTables: out must be one of 'keys', 'view' or 'mask'."
+            )
+
+    def neighbours(self, key, radius):
+        """
+        Find the nodes near a node.
+
+        Distances are between centres of potential (comoving), in a periodic
+        box if the TreeTables has a boxsize. Raises KeyError if the node is
+        filtered out or has no centre of potential (no subfind entry).
+
+        Parameters
+        ----------
+        key: int
+            Node key.
+
+        radius: float or Quantity
+            Search radius, in Mpc if given without units.
+
+        Returns
+        -------
+        out : ndarray
+            Keys of the other nodes at the same snapshot within radius.
+        """
+
+        row = self._rows([key])[0]
+        point = self._take("cops", np.array([row]))[0]
+        if np.any(np.isnan(point)):
+            raise KeyError(
+                "TreeTables: node {0:d} has no subfind entry.".format(key)
+            )
+        snapshot = self._columns["sns"][row]
+        keys = self.query_ball(point[np.newaxis], radius, snapshot)[0]
+        return keys[keys != key]
+
+    def query_ball(self, points, radius, snapshot):
+        """
+        Find the nodes near a set of points.
+
+        Uses a KD-tree over the centres of potential (comoving) of the nodes
+        at the snapshot, built on first use and kept until the filter
+        changes. The box is periodic if the TreeTables has a boxsize.
+        Requires scipy.
+
+        Parameters
+        ----------
+        points: array_like
+            Positions (shape (N, 3)), in Mpc if given without units.
+
+        radius: float or Quantity
+            Search radius, in Mpc if given without units.
+
+        snapshot: int
+            Snapshot number.
+
+        Returns
+        -------
+        out : list
+            For each point, the keys of the nodes within radius.
+        """
+
+        kdtree, rows = self._kdtree(snapshot)
+        points = np.atleast_2d(self._value("cops", points))
+        if self.boxsize is not None:
+            points = np.mod(points, self._value("cops", self.boxsize))
+        return [
+            self._columns["ids"][rows[np.sort(np.array(found, dtype=int))]]
+            for found in kdtree.query_ball_point(
+                points, self._value("cops", radius)
+            )
+        ]
+
+    def _kdtree(self, snapshot):
+        # KD-tree over the positions of the visible nodes at a snapshot, and
+        # the rows of the nodes in it
+        name = ("kdtree", snapshot)
+        if name not in self._index:
+            from scipy.spatial import cKDTree
+
+            rows = self._derive("sub_rows")
+            rows = rows[self._columns["sns"][rows] == snapshot]
+            cops = self._column("cops")[rows]
+            with self._stage(
+                "build KD-tree for snapshot {0:d}".format(snapshot)
+            ) as stage:
+                if self.boxsize is None:
+                    kdtree = cKDTree(cops)
+                else:
+                    boxsize = self._value("cops", self.boxsize)
+                    kdtree = cKDTree(np.mod(cops, boxsize), boxsize=boxsize)
+                stage.record(rows=len(rows))
+            self._index[name] = (kdtree, rows)
+        return self._index[name]
+
+    def _value(self, name, value):
+        # strip units from value, converting to the units of a column
+        if isinstance(value, tuple):
+            return tuple(self._value(name, v) for v in value)
+        elif hasattr(value, "unit"):
+            unit = self._units.get(name)
+            if unit is None:
+                unit = self._snapshot_units.get(name)
+            if unit is None:
+                raise ValueError(
+                    "TreeTables: column '{0:s}' has no units.".format(name)
+                )
+            return value.to_value(_unit(unit))
+        else:
+            return value
+
+    def reset_filter(self):
+        # undo mass_filter
+        self._mask = None
+        self._index = dict()
+        return
+
+    def view(self, mask):
+        """
+        Filtered view of the tables.
+
+        The view shares the columns with this TreeTables (no data is
+        copied), and Trees built from it include only the nodes passing the
+        filter. Filters already applied to this TreeTables also apply to the
+        view.
+
+        Parameters
+        ----------
+        mask: ndarray
+            Boolean mask over the rows of the tables, e.g. from mass_mask().
+
+        Returns
+        -------
+        out : TreeTables
+            Filtered view.
+        """
+
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view._filter(mask)
+        return view
+
     def _read_config(self):
-        _log("TreeTables: reading config file.")
+        logger.debug("TreeTables: reading config file.")
         try:
             spec = spec_from_file_location(
                 "config", expanduser(self.configfile)
@@ -0,0 +1,368 @@
+import numpy as np
+import os
+import json
+import shutil
+import operator
+from os.path import expanduser
+from collections import OrderedDict
+from contextlib import contextmanager
+from ._columns import _padding
+
+
+class _Store:
+    # directory of columns saved as .npy files, read in blocks of block_rows
+    # rows through a least-recently-used cache of at most cache_bytes
+
+    def __init__(self, directory, cache_bytes=1073741824, block_rows=65536):
+        self.directory = expanduser(directory)
+        self.cache_bytes = cache_bytes
+        self.block_rows = block_rows
+        os.makedirs(self.directory, exist_ok=True)
+        self._reset()
+        return
+
+    def _reset(self):
+        self._columns = dict()
+        self._cache = OrderedDict()
+        self._cached = 0
+        return
+
+    def __getstate__(self):
+        # open files and cached blocks stay behind
+        return {
+            "directory": self.directory,
+            "cache_bytes": self.cache_bytes,
+            "block_rows": self.block_rows,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+        return
+
+    @property
+    def chunk_rows(self):
+        # rows handled at a time when building columns, keeping the memory
+        # used of the order of cache_bytes
+        return max(self.block_rows, self.cache_bytes // 64)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".npy")
+
+    def metadata(self):
+        # what the columns were built from, as saved by save_metadata(), or
+        # None if not saved
+        path = os.path.join(self.directory, "metadata.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_metadata(self, metadata):
+        with open(os.path.join(self.directory, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+        return
+
+    def __contains__(self, name):
+        return os.path.exists(self._path(name))
+
+    def names(self):
+        return sorted(
+            f[: -len(".npy")]
+            for f in os.listdir(self.directory)
+            if f.endswith(".npy")
+        )
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            if name not in self:
+                raise KeyError(name)
+            self._columns[name] = _BlockColumn(self, name)
+        return self._columns[name]
+
+    def save(self, name, values):
+        # write then rename, so an interrupted write is not mistaken for a
+        # complete column
+        path = self._path(name)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, values)
+        return self._replace(name, path)
+
+    @contextmanager
+    def _writer(self, name, nrows, dtype, shape=()):
+        # write a column a piece at a time, in order, by calling the function
+        # given; the column replaces any of the same name once complete
+        header = {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": (nrows,) + tuple(shape),
+        }
+        path = self._path(name)
+        with open(path + ".tmp", "wb") as f:
+            np.lib.format.write_array_header_2_0(f, header)
+            yield lambda values: np.asarray(values, dtype=dtype).tofile(f)
+        self._replace(name, path)
+        return
+
+    def save_scattered(self, name, nrows, pieces, padded=True):
+        # save the column of nrows rows holding values at rows dests, for
+        # the (dests, values) pieces, and padding elsewhere (or zeros if not
+        # padded); the pieces are first distributed into temporary files by
+        # chunk of the column, so only a piece and a chunk are in memory at
+        # a time
+        chunk_rows = self.chunk_rows
+        like = None
+        with _Buckets(self._path(name) + ".scatter") as buckets:
+            for dests, values in pieces:
+                buckets.add(dests // chunk_rows, dests=dests, values=values)
+                like = values
+            if like is None:
+                raise ValueError("_Store: no values for " + name + ".")
+            if padded:
+                fill, dtype = _padding(like.dtype)
+            else:
+                fill, dtype = 0, like.dtype
+            shape = like.shape[1:]
+            with self._writer(name, nrows, dtype, shape) as write:
+                for b, start in enumerate(range(0, nrows, chunk_rows)):
+                    out = np.full(
+                        (min(chunk_rows, nrows - start),) + shape, fill, dtype
+                    )
+                    out[buckets.get(b, "dests") - start] = buckets.get(
+                        b, "values"
+                    )
+                    write(out)
+        return self[name]
+
+    def rename(self, name, new_name):
+        os.replace(self._path(name), self._path(new_name))
+        self._forget(name)
+        self._forget(new_name)
+        return self[new_name]
+
+    def remove(self, name):
+        os.remove(self._path(name))
+        self._forget(name)
+        return
+
+    def _replace(self, name, path):
+        os.replace(path + ".tmp", path)
+        self._forget(name)
+        return self[name]
+
+    def _forget(self, name):
+        # drop an open column and its cached blocks
+        if name in self._columns:
+            for b in range(self._columns[name].nblocks):
+                self._evict((name, b))
+            del self._columns[name]
+        return
+
+    def _evict(self, key):
+        block = self._cache.pop(key, None)
+        if block is not None:
+            self._cached -= block.nbytes
+        return
+
+    def block(self, column, b):
+        key = (column.name, b)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        block = column._read(b)
+        self._cache[key] = block
+        self._cached += block.nbytes
+        while self._cached > self.cache_bytes and len(self._cache) > 1:
+            self._evict(next(iter(self._cache)))
+        return block
+
+
+class _BlockColumn:
+    # read-only array-like column of a _Store; indexing and searchsorted
+    # read only the blocks they need, np.asarray() reads the whole column
+
+    def __init__(self, store, name):
+        self._store = store
+        self.name = name
+        self._file = None
+        self._fences = None
+        with open(store._path(name), "rb") as f:
+            version = np.lib.format.read_magic(f)
+            read_header = getattr(
+                np.lib.format, "read_array_header_{0}_{1}".format(*version)
+            )
+            self.shape, fortran_order, self.dtype = read_header(f)
+            self._offset = f.tell()
+        self._row_size = int(np.prod(self.shape[1:], dtype=np.int64))
+        self.nblocks = -(-len(self) // store.block_rows)
+        return
+
+    def __reduce__(self):
+        return (_BlockColumn, (self._store, self.name))
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return len(self) * self._row_size * self.dtype.itemsize
+
+    def _seek(self, row):
+        if self._file is None:
+            self._file = open(self._store._path(self.name), "rb")
+        self._file.seek(
+            self._offset + row * self._row_size * self.dtype.itemsize
+        )
+        return self._file
+
+    def _read(self, b, nrows=None):
+        start = b * self._store.block_rows
+        if nrows is None:
+            nrows = min(self._store.block_rows, len(self) - start)
+        values = np.fromfile(
+            self._seek(start), dtype=self.dtype, count=nrows * self._row_size
+        )
+        return values.reshape((nrows,) + self.shape[1:])
+
+    def _block(self, b):
+        return self._store.block(self, b)
+
+    def blocks(self):
+        for b in range(self.nblocks):
+            yield b * self._store.block_rows, self._block(b)
+
+    def __iter__(self):
+        for start, block in self.blocks():
+            yield from block
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            key, rest = key[0], key[1:]
+        else:
+            rest = ()
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._slice(start, stop, rest)
+            key = np.arange(start, stop, step)
+        elif isinstance(key, (int, np.integer)) or np.ndim(key) == 0:
+            i = operator.index(key)
+            i = i + len(self) if i < 0 else i
+            if not 0 <= i < len(self):
+                raise IndexError("index {0:d} out of range".format(i))
+            b, j = divmod(i, self._store.block_rows)
+            return self._block(b)[(j,) + rest]
+        key = np.asarray(key)
+        if key.dtype == bool:
+            key = np.flatnonzero(key)
+        return self._take(np.where(key < 0, key + len(self), key), rest)
+
+    def _slice(self, start, stop, rest):
+        block_rows = self._store.block_rows
+        b = start // block_rows
+        if 0 < stop - start and (stop - 1) // block_rows == b:
+            # within one block, as for small lookups
+            lo, hi = start - b * block_rows, stop - b * block_rows
+            return self._block(b)[(slice(lo, hi),) + rest]
+        empty = np.empty((0,) + self.shape[1:], self.dtype)
+        parts = [empty[(slice(None),) + rest]]
+        for b in range(start // block_rows, -(-stop // block_rows)):
+            lo = max(start - b * block_rows, 0)
+            hi = min(stop - b * block_rows, block_rows)
+            parts.append(self._block(b)[(slice(lo, hi),) + rest])
+        return np.concatenate(parts)
+
+    def _take(self, rows, rest):
+        blocks = rows // self._store.block_rows
+        if len(rows) > 0 and (blocks == blocks[0]).all():
+            # within one block, as for small lookups
+            b = blocks[0]
+            block = self._block(b)
+            return block[rows - b * self._store.block_rows][
+                (slice(None),) + rest
+            ]
+        values = np.empty((len(rows),) + self.shape[1:], self.dtype)
+        order = np.argsort(blocks, kind="stable")
+        bs, starts = np.unique(blocks[order], return_index=True)
+        for b, these in zip(bs, np.split(order, starts[1:])):
+            block = self._block(b)
+            values[these] = block[rows[these] - b * self._store.block_rows]
+        return values[(slice(None),) + rest]
+
+    def _fence(self):
+        # first value of each block, for binary searches
+        if self._fences is None:
+            self._fences = np.concatenate(
+                [np.empty(0, self.dtype)]
+                + [self._read(b, nrows=1)[:1] for b in range(self.nblocks)]
+            )
+        return self._fences
+
+    def searchsorted(self, values, side="left"):
+        # as for a sorted ndarray, searching the one block that matters
+        if isinstance(values, (list, tuple)) or getattr(values, "ndim", 0):
+            return np.array(
+                [self.searchsorted(value, side=side) for value in values],
+                dtype=np.int64,
+            )
+        b = max(int(self._fence().searchsorted(values, side=side)) - 1, 0)
+        if b >= self.nblocks:
+            return 0
+        block = self._block(b)
+        return b * self._store.block_rows + int(
+            block.searchsorted(values, side=side)
+        )
+
+
+class _Buckets:
+    # temporary files collecting rows of columns by bucket, for sorting and
+    # scattering columns too large to hold in memory; removed on exit
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._rows = dict()
+        return
+
+    def __enter__(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return False
+
+    def _path(self, b, name):
+        return os.path.join(self.directory, "{0:d}.{1:s}".format(b, name))
+
+    def add(self, buckets, **columns):
+        # append rows to the files of their buckets, in order
+        order = np.argsort(buckets, kind="stable")
+        bs, starts = np.unique(buckets[order], return_index=True)
+        for name, values in columns.items():
+            values = np.asarray(values)
+            self._rows[name] = (values.dtype, values.shape[1:])
+            for b, piece in zip(bs, np.split(values[order], starts[1:])):
+                with open(self._path(b, name), "ab") as f:
+                    piece.tofile(f)
+        return
+
+    def dtype(self, name):
+        return self._rows[name][0]
+
+    def get(self, b, name):
+        # rows of a column in a bucket, in the order they were added
+        dtype, shape = self._rows[name]
+        path = self._path(b, name)
+        if not os.path.exists(path):
+            return np.empty((0,) + shape, dtype=dtype)
+        return np.fromfile(path, dtype=dtype).reshape((-1,) + shape)
+
@@ -1,10 +1,142 @@
-from datetime import datetime
+import numpy as np
+import logging
+from time import perf_counter
+from functools import lru_cache
 
+logger = logging.getLogger("simtrees")
 
-def _log(*logmsgs):
 
-    T = datetime.now()
-    timer = " [{0:02d}:{1:02d}:{2:02d}]".format(T.hour, T.minute, T.second)
-    print(*((timer,) + logmsgs))
+def _record(report, stage, seconds, rows=None, nbytes=None):
+    # add an entry for a completed stage of work to report, and log it
+    entry = {
+        "stage": stage,
+        "seconds": seconds,
+        "rows": rows,
+        "bytes": nbytes,
+        "rows_per_second": None,
+        "bytes_per_second": None,
+    }
+    msg = "%s: %.3f s"
+    args = [stage, seconds]
+    if rows is not None:
+        msg += ", %d rows"
+        args.append(rows)
+        if seconds > 0:
+            entry["rows_per_second"] = rows / seconds
+    if nbytes is not None:
+        msg += ", %d bytes"
+        args.append(nbytes)
+        if seconds > 0:
+            entry["bytes_per_second"] = nbytes / seconds
+            msg += " (%.1f MB/s)"
+            args.append(entry["bytes_per_second"] / 1e6)
+    report.append(entry)
+    logger.info(msg, *args)
+    return
+
 
+def _tally(report, stage, seconds, rows=None):
+    # add to the single entry of report for a small stage of work repeated
+    # many times (such as growing a tree), creating it the first time, so
+    # that report does not grow with each repetition; not logged
+    for entry in report:
+        if entry["stage"] == stage:
+            break
+    else:
+        entry = {
+            "stage": stage,
+            "count": 0,
+            "seconds": 0.0,
+            "rows": 0,
+            "bytes": None,
+            "rows_per_second": None,
+            "bytes_per_second": None,
+        }
+        report.append(entry)
+    entry["count"] += 1
+    entry["seconds"] += seconds
+    entry["rows"] += 0 if rows is None else rows
+    if entry["seconds"] > 0:
+        entry["rows_per_second"] = entry["rows"] / entry["seconds"]
     return
+
+
+class _Stage:
+    # context manager timing a stage of work into report (if not None);
+    # rows and bytes processed can be added with record() before the stage
+    # ends; with a _MemoryProfile, memory use is recorded too, along with
+    # the sizes returned by the attributes callable
+
+    def __init__(self, report, stage, memory=None, attributes=None):
+        self._report = report
+        self._stage = stage
+        self._memory = memory
+        self._attributes = attributes
+        self._rows = None
+        self._nbytes = None
+        return
+
+    def __enter__(self):
+        if self._memory is not None:
+            self._memory.enter()
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = perf_counter() - self._start
+        if self._report is not None:
+            _record(
+                self._report,
+                self._stage,
+                seconds,
+                rows=self._rows,
+                nbytes=self._nbytes,
+            )
+        if self._memory is not None:
+            self._memory.exit(self._stage, self._attributes())
+        return False
+
+    def record(self, values=None, rows=None, nbytes=None):
+        # count an array (its length and size), or given rows and bytes
+        if values is not None:
+            rows, nbytes = len(values), values.nbytes
+        if rows is not None:
+            self._rows = (self._rows or 0) + rows
+        if nbytes is not None:
+            self._nbytes = (self._nbytes or 0) + nbytes
+        return
+
+
+class _NoStage:
+    # stand-in for _Stage when instrumentation is off
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def record(self, values=None, rows=None, nbytes=None):
+        return
+
+
+_no_stage = _NoStage()
+
+
+@lru_cache(maxsize=None)
+def _unit(name):
+    # parsed astropy unit for a unit string, cached since parsing is slow
+    import astropy.units as U
+
+    return U.Unit(name)
+
+
+def _intervals(positions, nmax):
+    # cover sorted positions with at most nmax (start, end) intervals,
+    # leaving out the largest gaps between them
+    gaps = np.diff(positions)
+    cuts = np.sort(np.argsort(gaps, kind="stable")[::-1][: nmax - 1])
+    cuts = cuts[gaps[cuts] > 1]
+    starts = np.concatenate((positions[:1], positions[cuts + 1]))
+    ends = np.concatenate((positions[cuts] + 1, positions[-1:] + 1))
+    return list(zip(starts.tolist(), ends.tolist()))
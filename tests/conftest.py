@@ -0,0 +1,61 @@
+import pytest
+from simtrees import TreeTables, write_forest
+
+# the forest of the configfile fixture unless a test module overrides it
+_default_forest = dict(ntrees=200, nparts=2, seed=1)
+
+
+@pytest.fixture(scope="session")
+def write_config(tmp_path_factory):
+    # factory writing a synthetic forest, with the write_forest() arguments
+    # given, and a configfile for it keyed by its last snapshot; forests are
+    # written once per session for each set of arguments
+    configfiles = dict()
+
+    def write_config(ntrees, **kwargs):
+        args = (ntrees,) + tuple(sorted(kwargs.items()))
+        if args not in configfiles:
+            directory = tmp_path_factory.mktemp("forest")
+            fbase, sfbase, nnodes = write_forest(directory, ntrees, **kwargs)
+            configfile = directory / "config.py"
+            configfile.write_text(
+                "paths = {{{0:d}: ({1!r}, {2!r}, {3!r})}}\n".format(
+                    kwargs.get("nsnap", 64) - 1, str(directory), fbase, sfbase
+                )
+            )
+            configfiles[args] = str(configfile)
+        return configfiles[args]
+
+    return write_config
+
+
+@pytest.fixture(scope="module")
+def forest(request):
+    # write_forest() arguments of the forest of the configfile fixture: the
+    # default forest, unless given by (indirect) parametrization or by a
+    # test module overriding this fixture
+    return getattr(request, "param", _default_forest)
+
+
+@pytest.fixture(scope="module")
+def configfile(forest, write_config):
+    return write_config(**forest)
+
+
+@pytest.fixture(scope="module")
+def treetables(forest, configfile):
+    # TreeTables of the forest of the configfile fixture, shared by the
+    # tests of a module: not to be filtered
+    return TreeTables(
+        forest.get("nsnap", 64) - 1, configfile, instrument=False
+    )
+
+
+@pytest.fixture(scope="module")
+def roots(forest, treetables):
+    # groups of the roots of the trees, at the last snapshot
+    return [
+        group
+        for group in treetables.sub_groups_r
+        if group[0] == forest.get("nsnap", 64) - 1
+    ]
@@ -0,0 +1,88 @@
+"""
+Stand-in for the simfiles package, for the use_snapshots tests.
+
+SimFiles serves the subfind catalogue of a snapshot of a forest written by
+simtrees.write_forest(), in the units of the tables. The forest is named in
+a configfile defining forest = (path, fbase, sfbase). Every load is logged
+to reads, as (snapshot, key, start, end) in catalogue rows.
+"""
+
+import runpy
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import astropy.units as U
+from simtrees._simtrees import h
+from simtrees._hdf5_io import hdf5_get
+
+Snap = namedtuple("Snap", ("sim", "snap"))
+
+# key: (dataset, unit, scaling), as simtrees scales the subfind tables
+_keys = {
+    "sgns": ("/Subhalo/SubGroupNumber", "", None),
+    "cops": ("/Subhalo/CentreOfPotential", "Mpc", 1 / h),
+    "vcents": ("/Subhalo/Velocity", "km / s", None),
+    "msubfind": ("/Subhalo/MassType", "Msun", 1e10 / h),
+}
+
+reads = []
+
+
+@lru_cache(maxsize=None)
+def _catalogues(configfile):
+    # rows of the subfind tables in each snapshot's catalogue, in order
+    path, fbase, sfbase = runpy.run_path(configfile)["forest"]
+    ids, sns, tabposs = (
+        hdf5_get(path, fbase, "/haloTrees/" + name, ncpu=1)
+        for name in ("nodeIndex", "snapshotNumber", "positionInCatalogue")
+    )
+    tf_ids = hdf5_get(path, sfbase, "/Subhalo/nodeIndex", ncpu=1)
+    order = np.argsort(ids)
+    rows = order[np.searchsorted(ids, tf_ids, sorter=order)]
+    catalogues = dict()
+    for sn in np.unique(sns[rows]):
+        these = np.flatnonzero(sns[rows] == sn)
+        catalogue = np.empty(len(these), dtype=np.int64)
+        catalogue[tabposs[rows[these]]] = these
+        catalogues[int(sn)] = catalogue
+    return path, sfbase, catalogues
+
+
+@lru_cache(maxsize=None)
+def _table(configfile, key):
+    path, sfbase, catalogues = _catalogues(configfile)
+    hpath, unit, scale = _keys[key]
+    values = hdf5_get(path, sfbase, hpath, ncpu=1)
+    if scale is not None:
+        values *= scale
+    return values
+
+
+class SimFiles:
+    def __init__(self, snap_id, configfile=None, ncpu=1):
+        self.snap_id = snap_id
+        self.configfile = configfile
+        self._loaded = dict()
+        return
+
+    def load(self, keys=tuple(), intervals=None):
+        catalogue = _catalogues(self.configfile)[2][self.snap_id.snap]
+        if intervals is None:
+            intervals = ((0, len(catalogue)),) * len(keys)
+        for key, (start, end) in zip(keys, intervals):
+            reads.append((self.snap_id.snap, key, start, end))
+            values = _table(self.configfile, key)[catalogue[start:end]]
+            self._loaded[key] = U.Quantity(
+                values, _keys[key][1], dtype=values.dtype, copy=False
+            )
+        return
+
+    def __getattr__(self, key):
+        try:
+            return self.__dict__["_loaded"][key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __delitem__(self, key):
+        del self._loaded[key]
+        return
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from simtrees import Tree
+
+
+def _roots(treetables, roots):
+    return [group for group in roots if group in treetables.sub_groups_r]
+
+
+def _nodes(treetables, roots):
+    # the nodes of the trees of the roots visible in treetables
+    nodes = []
+    for group in _roots(treetables, roots):
+        tree = Tree(group, treetables=treetables)
+        nodes.extend(tree.nodes.values())
+    return nodes
+
+
+def _final(node):
+    while node.desc is not None:
+        node = node.desc
+    return node.key
+
+
+def _merge_snapshot(treetables, node):
+    # snapshot of the first descendant whose main progenitor is not on the
+    # branch of the node, walking descendants one by one
+    while node.desc is not None:
+        if node.desc.progs[0] is not node:
+            return treetables._columns["sns"][
+                treetables._columns["ids"].searchsorted(node.desc.key)
+            ]
+        node = node.desc
+    return -1
+
+
+@pytest.mark.parametrize("cut", [None, 1e9, 1e10])
+def test_tree_nodes(treetables, roots, cut):
+    if cut is not None:
+        treetables = treetables.view(treetables.mass_mask(cut))
+    nodes = _nodes(treetables, roots)
+    assert len(nodes) > len(_roots(treetables, roots))
+    keys = [node.key for node in nodes]
+    assert treetables.final_descendant(keys).tolist() == [
+        _final(node) for node in nodes
+    ]
+    assert treetables.merge_snapshot(keys).tolist() == [
+        _merge_snapshot(treetables, node) for node in nodes
+    ]
+
+
+@pytest.mark.parametrize("cut", [None, 1e10])
+def test_all_nodes(treetables, cut):
+    # every node, following descendant ids for as long as they are visible
+    ids = treetables._columns["ids"]
+    descids = treetables._columns["descids"]
+    visible = np.ones(len(ids), dtype=bool)
+    if cut is not None:
+        visible = treetables.mass_mask(cut)
+        treetables = treetables.view(visible)
+    rows = {key: row for row, key in enumerate(ids.tolist()) if visible[row]}
+    expected = []
+    for row in rows.values():
+        while descids[row] != ids[row] and descids[row] in rows:
+            row = rows[descids[row]]
+        expected.append(ids[row])
+    keys = list(rows)
+    assert treetables.final_descendant(keys).tolist() == expected
+
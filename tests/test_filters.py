@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from simtrees import TreeTables
+
+
+@pytest.fixture
+def treetables(configfile):
+    return TreeTables(63, configfile, instrument=False)
+
+
+def test_apply_filter(treetables):
+    mask = treetables.mass_mask(1e9) & ~treetables.mass_mask(1e10)
+    view = treetables.view(mask)
+    treetables.apply_filter(mask)
+    assert len(treetables.tree_descid) == np.count_nonzero(mask)
+    assert list(treetables.sub_groups_r) == list(view.sub_groups_r)
+    treetables.reset_filter()
+    assert len(treetables.tree_descid) == len(mask)
+
+
+def test_mass_filter_rejects_masks(treetables):
+    with pytest.raises(ValueError, match="apply_filter"):
+        treetables.mass_filter(treetables.mass_mask(1e9))
+
+
+def test_filter_shape(treetables):
+    mask = treetables.mass_mask(1e9)
+    with pytest.raises(ValueError):
+        treetables.apply_filter(mask[1:])
+    with pytest.raises(ValueError):
+        treetables.view(mask.astype(int))
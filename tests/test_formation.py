@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from simtrees import Tree
+
+
+def _plain(values):
+    return np.asarray(getattr(values, "value", values))
+
+
+def _brute(treetables, root, particle_type, fraction):
+    # formation snapshot, peak mass and peak snapshot of a root, walking its
+    # trunk node by node
+    tree = Tree(root, treetables=treetables)
+    ids = treetables._columns["ids"]
+    rows = [ids.searchsorted(node.key) for node in tree.trunk]
+    masses = _plain(treetables._column("masstypes"))[rows, particle_type]
+    sns = treetables._columns["sns"][rows]
+    formation = -1
+    if not np.isnan(masses[0]):
+        formation = sns[-1]
+        for i, mass in enumerate(masses):
+            if mass < fraction * masses[0]:
+                formation = sns[i - 1]
+                break
+    if np.all(np.isnan(masses)):
+        return formation, np.nan, -1
+    peak = np.nanargmax(masses)
+    return formation, masses[peak], sns[peak]
+
+
+@pytest.mark.parametrize(
+    "particle_type, fraction", [(1, 0.5), (4, 0.5), (1, 0.25)]
+)
+def test_formation(treetables, roots, particle_type, fraction):
+    keys = [treetables.sub_groups_r[group] for group in roots]
+    out = treetables.formation(
+        keys, particle_type=particle_type, fraction=fraction
+    )
+    peak_mass = _plain(out["peak_mass"])
+    for i, root in enumerate(roots):
+        formation, mass, snapshot = _brute(
+            treetables, root, particle_type, fraction
+        )
+        assert out["formation_snapshot"][i] == formation
+        assert np.array_equal(peak_mass[i], mass, equal_nan=True)
+        assert out["peak_snapshot"][i] == snapshot
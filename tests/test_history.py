@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from simtrees import Tree
+
+
+def _column(treetables, name, keys):
+    # values of a column for nodes, looked up one by one
+    ids = treetables._columns["ids"]
+    column = treetables._column(name)
+    return np.array([column[ids.searchsorted(key)] for key in keys])
+
+
+def _branch(node):
+    # nodes along the main branch from a node, following first progenitors
+    branch = [node]
+    while branch[-1].progs:
+        branch.append(branch[-1].progs[0])
+    return [node.key for node in branch]
+
+
+@pytest.fixture(scope="module")
+def nodes(treetables, roots):
+    # the roots, and some other nodes of their trees
+    nodes = []
+    for group in roots[:20]:
+        tree = Tree(group, treetables=treetables)
+        nodes.extend(list(tree.nodes.values())[::10])
+    return nodes
+
+
+def _plain(values):
+    return np.asarray(getattr(values, "value", values))
+
+
+@pytest.mark.parametrize("field", ["masstypes", "cops", "sgns", "descids"])
+def test_history(treetables, nodes, field):
+    keys = [node.key for node in nodes]
+    padded = _plain(treetables.history(keys, field))
+    sns, values = treetables.history(keys, field, ragged=True)
+    fill = -1 if padded.dtype.kind == "i" else np.nan
+    for i, node in enumerate(nodes):
+        branch = _branch(node)
+        expected = _column(treetables, field, branch)
+        expected_sns = _column(treetables, "sns", branch)
+        assert sns[i].tolist() == expected_sns.tolist()
+        assert np.array_equal(_plain(values[i]), expected, equal_nan=True)
+        row = np.full_like(padded[i], fill)
+        row[expected_sns] = expected
+        assert np.array_equal(padded[i], row, equal_nan=True)
+
+
+def test_trunk_array(treetables, roots):
+    for group in roots[:20]:
+        tree = Tree(group, treetables=treetables)
+        trunk = [node.key for node in tree.trunk]
+        assert np.array_equal(
+            _plain(tree.trunk_array("masstypes")),
+            _column(treetables, "masstypes", trunk),
+            equal_nan=True,
+        )
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from simtrees import Tree, TreeTables
+from simtrees._simtrees import h
+
+
+@pytest.fixture(scope="module")
+def forest():
+    # a small box, so that branches cross its edges, and many interpolated
+    # nodes, some of them in a row along a branch
+    return dict(ntrees=50, nparts=1, seed=3, interpolated=0.2, boxsize=2.0)
+
+
+def _plain(values):
+    return np.asarray(getattr(values, "value", values))
+
+
+def _nearest(node, step):
+    # nearest node with a subfind entry following step (None if none)
+    node = step(node)
+    while node is not None and not node.in_tab:
+        node = step(node)
+    return node
+
+
+def _brute(treetables, node, name, boxsize):
+    # value of an interpolated node, from its nearest main progenitor and
+    # descendant with subfind entries
+    prog = _nearest(node, lambda node: node.progs[0] if node.progs else None)
+    desc = _nearest(node, lambda node: node.desc)
+    column = _plain(treetables._column(name))
+    if prog is None or desc is None:
+        return column[node.row]
+    t = (node.sn - prog.sn) / (desc.sn - prog.sn)
+    start, end = column[prog.row], column[desc.row]
+    step = end - start
+    if name == "cops" and boxsize is not None:
+        step = step - boxsize * np.round(step / boxsize)
+        return np.mod(start + t * step, boxsize)
+    return start + t * step
+
+
+@pytest.fixture(scope="module", params=[None, 2.0 / h], ids=["", "box"])
+def interpolated(request, configfile):
+    return TreeTables(
+        63,
+        configfile,
+        instrument=False,
+        units=False,
+        boxsize=request.param,
+        interpolate=True,
+    )
+
+
+@pytest.fixture(scope="module")
+def nodes(interpolated, roots):
+    # the nodes of the trees of the roots, with their rows, snapshots and
+    # whether they have a subfind entry
+    ids = interpolated._columns["ids"]
+    nodes = []
+    for group in roots:
+        nodes.extend(Tree(group, treetables=interpolated).nodes.values())
+    for node in nodes:
+        node.row = ids.searchsorted(node.key)
+        node.sn = interpolated._columns["sns"][node.row]
+        node.in_tab = interpolated._columns["in_tab"][node.row]
+    return nodes
+
+
+@pytest.mark.parametrize("name", ["cops", "vels", "masstypes"])
+def test_interpolate(interpolated, treetables, nodes, name):
+    keys = [node.key for node in nodes]
+    sns, values = interpolated.history(keys, name, ragged=True)
+    plain = _plain(treetables._column(name))
+    boxsize = interpolated.boxsize
+    filled, wrapped = 0, 0
+    for node, branch in zip(nodes, values):
+        if node.in_tab:
+            expected = plain[node.row]
+        else:
+            expected = _brute(interpolated, node, name, boxsize)
+            unwrapped = _brute(interpolated, node, name, None)
+            filled += not np.any(np.isnan(expected))
+            wrapped += not np.allclose(expected, unwrapped, equal_nan=True)
+        assert np.allclose(branch[0], expected, equal_nan=True)
+    assert filled > 100
+    assert (wrapped > 0) == (name == "cops" and boxsize is not None)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from simtrees import join_ids
+
+
+def _pairs(left_index, right_index):
+    return list(zip(left_index.tolist(), right_index.tolist()))
+
+
+def _brute(left, right, duplicates):
+    # (left, right) index pairs of equal ids, by looping over both arrays
+    pairs = []
+    for i, value in enumerate(left.tolist()):
+        found = [j for j, other in enumerate(right.tolist()) if other == value]
+        if duplicates == "first":
+            found = found[:1]
+        elif duplicates == "last":
+            found = found[-1:]
+        pairs.extend((i, j) for j in found)
+    return pairs
+
+
+@pytest.fixture
+def ids():
+    rng = np.random.default_rng(0)
+    # duplicates in both arrays, and ids in only one of them
+    left = rng.integers(0, 300, 200)
+    right = rng.integers(100, 400, 250)
+    return left, right
+
+
+@pytest.mark.parametrize("duplicates", ["first", "last", "all"])
+def test_duplicates(ids, duplicates):
+    left, right = ids
+    left_index, right_index = join_ids(left, right, duplicates=duplicates)
+    assert np.array_equal(left[left_index], right[right_index])
+    assert np.all(np.diff(left_index) >= 0)
+    assert _pairs(left_index, right_index) == _brute(left, right, duplicates)
+
+
+def test_unique(ids):
+    left, right = ids
+    right = np.unique(right)[::-1]
+    left_index, right_index = join_ids(left, right)
+    assert _pairs(left_index, right_index) == _brute(left, right, "all")
+
+
+def test_missing_ids():
+    left_index, right_index = join_ids([5, 1, 7, 3], [3, 4, 5])
+    assert left_index.tolist() == [0, 3]
+    assert right_index.tolist() == [2, 0]
+    left_index, right_index = join_ids([1, 2], [])
+    assert len(left_index) == len(right_index) == 0
+
+
+def test_raise(ids):
+    left, right = ids
+    with pytest.raises(ValueError, match="more than once"):
+        join_ids(left, right)
+    with pytest.raises(ValueError, match="duplicates must be"):
+        join_ids(left, np.unique(right), duplicates="any")
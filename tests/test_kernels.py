@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from simtrees import Tree
+from simtrees import _kernels
+
+
+def _plain(values):
+    return np.asarray(getattr(values, "value", values))
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def backend(request, monkeypatch):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    monkeypatch.setattr(_kernels, "backend", request.param)
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def trees(treetables, roots):
+    return [Tree(group, treetables=treetables) for group in roots[:50]]
+
+
+def test_numpy_matches_loops(treetables, roots):
+    # the NumPy kernels against the uncompiled loops, on the forest
+    offsets = treetables._derive("child_offsets")
+    children = treetables._derive("child_rows")
+    main_rows = treetables._derive("main_rows")
+    desc_rows = treetables._derive("desc_rows")
+    sns = np.asarray(treetables._columns["sns"])
+    order = np.argsort(sns, kind="stable")
+    rows = treetables._rows([treetables.sub_groups_r[g] for g in roots])
+    for numpy, loops, args in (
+        (
+            _kernels._gather_numpy,
+            _kernels._gather_loops,
+            ((offsets, children, rows),) * 2,
+        ),
+        (
+            _kernels._main_branches_numpy,
+            _kernels._main_branches_loops,
+            ((rows, main_rows),) * 2,
+        ),
+        (
+            _kernels._subtree_sums_numpy,
+            _kernels._subtree_sums_loops,
+            (
+                (desc_rows, sns, np.arange(len(sns), dtype=float)),
+                (desc_rows, order, np.arange(len(sns), dtype=float)),
+            ),
+        ),
+        (
+            _kernels._depths_numpy,
+            _kernels._depths_loops,
+            ((desc_rows, sns), (desc_rows, order[::-1])),
+        ),
+    ):
+        assert np.array_equal(numpy(*args[0]), loops(*args[1]))
+
+
+def test_numba_requires_numba(monkeypatch):
+    monkeypatch.setattr(_kernels, "_compiled", lambda name: None)
+    monkeypatch.setattr(_kernels, "backend", "numba")
+    with pytest.raises(ImportError, match="numba"):
+        _kernels._kernel("gather")
+
+
+def _depth(node):
+    depth = 0
+    while node.desc is not None:
+        node, depth = node.desc, depth + 1
+    return depth
+
+
+def test_subtrees(treetables, trees, backend):
+    masstypes = _plain(treetables._column("masstypes"))
+    ids = treetables._columns["ids"]
+    for tree in trees:
+        for node in list(tree.nodes.values())[::20]:
+            subtree = [node]
+            for prog in subtree:
+                subtree.extend(prog.progs)
+            keys = [prog.key for prog in subtree]
+            assert treetables.subtree(node.key).tolist() == keys
+            assert treetables.subtree_size([node.key])[0] == len(keys)
+            mass = np.nansum(masstypes[ids.searchsorted(keys), 1])
+            assert np.isclose(
+                _plain(treetables.subtree_mass([node.key]))[0], mass
+            )
+            assert treetables.depth([node.key])[0] == _depth(node)
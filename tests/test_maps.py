@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from simtrees import TreeTables
+from simtrees import _columns
+
+_maps = ("sub_groups", "sub_cops", "tree_descid", "sub_groups_r")
+
+
+@pytest.fixture(params=["memory", "store", "filtered"])
+def treetables(request, configfile, tmp_path, monkeypatch):
+    # small chunks, so that iterating spans several of them
+    monkeypatch.setattr(_columns, "_chunk_rows", 1000)
+    store = str(tmp_path / "store") if request.param == "store" else None
+    treetables = TreeTables(63, configfile, instrument=False, store=store)
+    if request.param == "filtered":
+        treetables.mass_filter(1e9)
+    return treetables
+
+
+def _plain(value):
+    return np.asarray(getattr(value, "value", value))
+
+
+@pytest.mark.parametrize("name", _maps)
+def test_items_match_lookups(treetables, name):
+    mapping = getattr(treetables, name)
+    items = list(mapping.items())
+    assert len(items) == len(mapping) > 1000
+    assert [key for key, value in items] == list(mapping)
+    assert [key for key, value in items] == list(mapping.keys())
+    for (key, value), other in zip(items, mapping.values()):
+        assert np.array_equal(_plain(value), _plain(mapping[key]))
+        assert np.array_equal(_plain(other), _plain(value))
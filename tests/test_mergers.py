@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from simtrees import Tree
+
+
+def _plain(values):
+    return np.asarray(getattr(values, "value", values))
+
+
+def _brute(treetables, roots):
+    # (descendant, main, progenitor) for every progenitor but the first of
+    # every node of the trees of the roots, and the keys of those nodes
+    mergers, nodes = set(), set()
+    for group in roots:
+        if group not in treetables.sub_groups_r:
+            continue
+        tree = Tree(group, treetables=treetables)
+        nodes.update(tree.nodes)
+        for node in tree.nodes.values():
+            for prog in node.progs[1:]:
+                mergers.add((node.key, node.progs[0].key, prog.key))
+    return mergers, nodes
+
+
+def _catalogue(mergers, descendants):
+    # the mergers of a catalogue into the descendants given
+    return {
+        (desc, main, prog)
+        for desc, main, prog in zip(
+            mergers["descendant"].tolist(),
+            mergers["main"].tolist(),
+            mergers["progenitor"].tolist(),
+        )
+        if desc in descendants
+    }
+
+
+def test_mergers(treetables, roots):
+    expected, nodes = _brute(treetables, roots)
+    assert len(expected) > 100
+    mergers = treetables.mergers()
+    found = _catalogue(mergers, nodes)
+    assert found == expected
+    masstypes = _plain(treetables._column("masstypes"))
+    ids = treetables._columns["ids"]
+    keys = mergers["descendant"], mergers["main"], mergers["progenitor"]
+    desc_rows, main_rows, rows = (ids.searchsorted(key) for key in keys)
+    assert np.array_equal(
+        mergers["snapshot"], treetables._columns["sns"][desc_rows]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = masstypes[rows] / masstypes[main_rows]
+    assert np.array_equal(
+        _plain(mergers["mass_ratios"]), ratios, equal_nan=True
+    )
+    mbpcs = treetables._columns["mbpcs"]
+    assert np.all(mergers["main_mbpcs"] == mbpcs[main_rows])
+    assert np.all(mergers["mbpcs"] == mbpcs[rows])
+    assert np.all(mergers["main_mbpcs"] >= mergers["mbpcs"])
+
+
+@pytest.mark.parametrize("cut", [1e9, 1e10])
+def test_filtered(treetables, roots, cut):
+    view = treetables.view(treetables.mass_mask(cut))
+    expected, nodes = _brute(view, roots)
+    assert len(expected) > 0
+    assert _catalogue(view.mergers(), nodes) == expected
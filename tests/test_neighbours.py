@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+
+def test_neighbours(treetables):
+    key = treetables._columns["ids"][treetables._columns["in_tab"]][0]
+    keys = treetables.neighbours(key, 10.0)
+    assert key not in keys
+
+
+def test_neighbours_missing_key(treetables):
+    with pytest.raises(KeyError):
+        treetables.neighbours(np.max(treetables._columns["ids"]) + 1, 10.0)
+
+
+def test_neighbours_without_subfind_entry(treetables):
+    in_tab = treetables._columns["in_tab"]
+    if np.all(in_tab):
+        pytest.skip("no interpolated nodes")
+    key = treetables._columns["ids"][~in_tab][0]
+    with pytest.raises(KeyError, match="no subfind entry"):
+        treetables.neighbours(key, 10.0)
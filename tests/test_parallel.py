@@ -0,0 +1,37 @@
+import pytest
+from simtrees import Tree
+
+
+@pytest.fixture(scope="module")
+def forest():
+    # deep enough that pickling linked nodes would hit the recursion limit
+    return dict(
+        ntrees=4,
+        nsnap=200,
+        nparts=2,
+        seed=3,
+        mlow=1.0,
+        merged=0.002,
+        accretion=0.002,
+    )
+
+
+def _structure(tree):
+    return (
+        [node.key for node in tree.trunk],
+        {
+            key: [prog.key for prog in node.progs]
+            for key, node in tree.nodes.items()
+        },
+    )
+
+
+@pytest.mark.parametrize("ncpu", [1, 2])
+def test_build_trees_parallel(treetables, roots, ncpu):
+    trees = treetables.build_trees_parallel(roots, ncpu=ncpu)
+    assert max(len(tree.trunk) for tree in trees) > 150
+    for group, tree in zip(roots, trees):
+        expected = Tree(group, treetables=treetables)
+        assert tree.treetables is treetables
+        assert tree.root.key == expected.root.key
+        assert _structure(tree) == _structure(expected)
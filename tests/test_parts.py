@@ -0,0 +1,80 @@
+import os
+import runpy
+import shutil
+import numpy as np
+import pytest
+from simtrees import TreeTables
+from simtrees._hdf5_io import hdf5_sizes
+
+
+@pytest.fixture(scope="module")
+def forest():
+    # more parts than trees, so that the last parts are empty
+    return dict(ntrees=2, nparts=4, seed=5)
+
+
+def test_roots(configfile):
+    treetables = TreeTables(63, configfile, instrument=False)
+    groups = [group for group in treetables.sub_groups_r if group[0] == 63]
+    for group in groups:
+        some = TreeTables(63, configfile, instrument=False, roots=[group])
+        assert group in some.sub_groups_r
+        assert len(some.sub_groups) < len(treetables.sub_groups)
+
+
+@pytest.mark.parametrize("part", [-1, 4])
+def test_part_out_of_range(configfile, part):
+    with pytest.raises(ValueError, match="no part"):
+        TreeTables(63, configfile, parts=[part])
+
+
+def test_empty_part(configfile):
+    with pytest.raises(ValueError, match="holds no trees"):
+        TreeTables(63, configfile, parts=[3])
+
+
+def _reads(treetables, hpath):
+    # rows read from a dataset
+    return sum(
+        timing["rows"]
+        for timing in treetables.timings
+        if timing["stage"] == "read " + hpath
+    )
+
+
+@pytest.fixture(scope="module")
+def swapped(configfile, tmp_path_factory):
+    # the forest with the first two subfind files swapped, so that parts of
+    # the tree and subfind files no longer pair up
+    path, fbase, sfbase = runpy.run_path(configfile)["paths"][63]
+    directory = tmp_path_factory.mktemp("swapped")
+    for name in os.listdir(path):
+        shutil.copy(os.path.join(path, name), directory)
+    for a, b in ((0, "tmp"), (1, 0), ("tmp", 1)):
+        os.rename(
+            directory / "{0:s}.{1}.hdf5".format(sfbase, a),
+            directory / "{0:s}.{1}.hdf5".format(sfbase, b),
+        )
+    swapped = directory / "config.py"
+    swapped.write_text(
+        "paths = {{63: ({0!r}, {1!r}, {2!r})}}\n".format(
+            str(directory), fbase, sfbase
+        )
+    )
+    return str(swapped)
+
+
+@pytest.mark.parametrize("paired", [True, False])
+def test_reads_subfind_parts(configfile, swapped, paired):
+    path, fbase, sfbase = runpy.run_path(configfile)["paths"][63]
+    sizes = hdf5_sizes(path, sfbase, "/Subhalo/nodeIndex")
+    treetables = TreeTables(63, configfile, instrument=False)
+    some = TreeTables(63, configfile if paired else swapped, parts=[0])
+    hpath = "/Subhalo/nodeIndex"
+    if paired:
+        assert _reads(some, hpath) == sizes[0] < sum(sizes)
+    else:
+        assert _reads(some, hpath) == sum(sizes)
+    assert len(some.sub_masstypes) == sizes[0]
+    for key, masstypes in some.sub_masstypes.items():
+        assert np.array_equal(masstypes, treetables.sub_masstypes[key])
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+
+def test_centrals(treetables):
+    keys = treetables.select(subgroup=(None, 1))
+    sub_groups = treetables.sub_groups
+    assert len(keys) > 0
+    assert all(key in sub_groups for key in keys.tolist())
+    expected = [
+        key for key, (sn, gn, sgn) in sub_groups.items() if sgn == 0
+    ]
+    assert keys.tolist() == expected
+
+
+def test_snapshot_includes_interpolated(treetables):
+    in_tab = treetables._columns["in_tab"]
+    keys = treetables.select(snapshot=(None, None))
+    assert len(keys) == len(in_tab)
+    keys = treetables.select(snapshot=(None, None), speed=(None, None))
+    assert len(keys) == np.count_nonzero(in_tab)
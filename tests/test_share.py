@@ -0,0 +1,48 @@
+import pickle
+import pytest
+from simtrees import Tree, TreeTables
+
+
+@pytest.fixture
+def shared(configfile):
+    treetables = TreeTables(63, configfile, instrument=False).share()
+    yield treetables
+    treetables.release()
+
+
+def _trees(treetables, ngroups=10):
+    groups = [group for group in treetables.sub_groups_r if group[0] == 63]
+    return {
+        group: sorted(Tree(group, treetables=treetables).nodes)
+        for group in groups[:ngroups]
+    }
+
+
+def _copy(treetables):
+    return pickle.loads(pickle.dumps(treetables))
+
+
+def test_copy_attaches_shared_index(shared):
+    copy = _copy(shared)
+    assert set(copy._index) == set(TreeTables._shared_indices)
+    assert _trees(copy) == _trees(shared)
+    copy.release()
+
+
+def test_filter_after_share(shared):
+    unfiltered = len(shared.sub_groups)
+    shared.mass_filter(1e9)
+    assert len(shared.sub_groups) < unfiltered
+    copy = _copy(shared)
+    assert copy._index == dict()
+    assert len(copy.sub_groups) == len(shared.sub_groups)
+    assert _trees(copy) == _trees(shared)
+    copy.release()
+
+
+def test_view_of_shared(shared):
+    view = shared.view(shared.mass_mask(1e9))
+    copy = _copy(view)
+    assert len(copy.sub_groups) == len(view.sub_groups)
+    assert _trees(copy) == _trees(view)
+    copy.release()
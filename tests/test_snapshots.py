@@ -0,0 +1,137 @@
+import os
+import runpy
+import numpy as np
+import pytest
+from simtrees import TreeTables
+
+_stubs = os.path.join(os.path.dirname(__file__), "stubs")
+_names = ("sgns", "cops", "vels", "masstypes")
+
+
+@pytest.fixture(autouse=True)
+def simfiles(monkeypatch):
+    # the stand-in simfiles, with its log of reads cleared
+    monkeypatch.syspath_prepend(_stubs)
+    import simfiles
+
+    del simfiles.reads[:]
+    return simfiles
+
+
+@pytest.fixture(scope="module")
+def configfiles(configfile, tmp_path_factory):
+    # configfiles for the TreeTables and the stand-in simfiles, for the
+    # forest of the configfile fixture
+    path, fbase, sfbase = runpy.run_path(configfile)["paths"][63]
+    directory = tmp_path_factory.mktemp("snapshots")
+    snap_config = directory / "config.py"
+    snap_config.write_text(
+        "paths = {{('forest', 63): ({0!r}, {1!r}, {2!r})}}\n".format(
+            path, fbase, sfbase
+        )
+    )
+    simfiles_config = directory / "simfiles_config.py"
+    simfiles_config.write_text(
+        "forest = ({0!r}, {1!r}, {2!r})\n".format(path, fbase, sfbase)
+    )
+    return str(snap_config), str(simfiles_config)
+
+
+@pytest.fixture(scope="module")
+def expected(configfile):
+    # the columns as read from the subfind tables
+    treetables = TreeTables(63, configfile, instrument=False, units=False)
+    return {
+        name: np.asarray(treetables._column(name))
+        for name in ("ids",) + _names
+    }
+
+
+def _treetables(simfiles, configfiles, **kwargs):
+    snap_config, simfiles_config = configfiles
+    return TreeTables(
+        simfiles.Snap("forest", 63),
+        snap_config,
+        use_snapshots=True,
+        simfiles_config=simfiles_config,
+        instrument=False,
+        units=False,
+        **kwargs
+    )
+
+
+def _check(treetables, expected):
+    for name in ("ids",) + _names:
+        assert np.array_equal(
+            treetables._column(name), expected[name], equal_nan=True
+        ), name
+
+
+@pytest.mark.parametrize("ncpu", [1, 2])
+def test_matches_subfind_tables(simfiles, configfiles, expected, ncpu):
+    _check(_treetables(simfiles, configfiles, ncpu=ncpu), expected)
+
+
+def test_reads_only_tree_rows(simfiles, configfiles):
+    treetables = _treetables(simfiles, configfiles, parts=[0])
+    in_tab = treetables._columns["in_tab"]
+    sns = treetables._columns["sns"][in_tab]
+    tabposs = treetables._columns["tabposs"][in_tab]
+    catalogues = simfiles._catalogues(configfiles[1])[2]
+    assert len(tabposs) < sum(len(rows) for rows in catalogues.values())
+    for key in ("sgns", "cops", "vcents", "msubfind"):
+        for sn in catalogues:
+            intervals = [
+                (start, end)
+                for snap, k, start, end in simfiles.reads
+                if snap == sn and k == key
+            ]
+            these = tabposs[sns == sn]
+            assert sum(end - start for start, end in intervals) == len(these)
+            assert all(
+                any(start <= tabpos < end for start, end in intervals)
+                for tabpos in these.tolist()
+            )
+
+
+def test_checkpoint_resume(simfiles, configfiles, expected, tmp_path):
+    checkpoint_dir = str(tmp_path)
+    _treetables(simfiles, configfiles, checkpoint_dir=checkpoint_dir)
+    assert {sn for sn, key, start, end in simfiles.reads} == set(
+        simfiles._catalogues(configfiles[1])[2]
+    )
+    # one checkpoint lost, and one snapshot's checkpoints left incomplete
+    os.remove(os.path.join(checkpoint_dir, "cops_0040.npz"))
+    for name in os.listdir(checkpoint_dir):
+        if name.endswith("_0050.npz"):
+            os.rename(
+                os.path.join(checkpoint_dir, name),
+                os.path.join(checkpoint_dir, name + ".tmp"),
+            )
+    del simfiles.reads[:]
+    treetables = _treetables(
+        simfiles, configfiles, checkpoint_dir=checkpoint_dir
+    )
+    assert {sn for sn, key, start, end in simfiles.reads} == {40, 50}
+    _check(treetables, expected)
+
+
+def test_quantities(simfiles, configfiles, configfile):
+    import astropy.units as U
+
+    pytest.importorskip("scipy")
+    treetables = _treetables(simfiles, configfiles)
+    reference = TreeTables(63, configfile, instrument=False)
+    assert treetables._unit("cops") is None
+    predicates = dict(
+        box=((10000 * U.kpc, 0.05 * U.Gpc), None, None),
+        speed=(None, 300 * U.km / U.s),
+    )
+    keys = treetables.select(**predicates)
+    assert len(keys) > 0
+    assert np.array_equal(keys, reference.select(**predicates))
+    key = keys[0]
+    assert np.array_equal(
+        treetables.neighbours(key, 5000 * U.kpc),
+        reference.neighbours(key, 5 * U.Mpc),
+    )
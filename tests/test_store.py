@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from simtrees import Tree, TreeTables
+from simtrees._store import _Store
+
+
+def _plain(values):
+    return np.asarray(getattr(values, "value", values))
+
+
+@pytest.fixture(scope="module")
+def store(configfile, tmp_path_factory):
+    # store directory, built with small chunks so that sorts and scatters
+    # span several buckets
+    directory = str(tmp_path_factory.mktemp("store"))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(_Store, "chunk_rows", property(lambda self: 5000))
+        TreeTables(
+            63, configfile, instrument=False, store=directory, cache_bytes=1e6
+        )
+    return directory
+
+
+@pytest.fixture(params=[None, 1e9])
+def pair(request, configfile, store):
+    # TreeTables in memory and out of core, with the same filter
+    pair = (
+        TreeTables(63, configfile, instrument=False),
+        TreeTables(63, configfile, instrument=False, store=store),
+    )
+    if request.param is not None:
+        for treetables in pair:
+            treetables.mass_filter(request.param)
+    return pair
+
+
+def test_columns(pair):
+    memory, stored = pair
+    assert sorted(stored._columns) == sorted(memory._columns)
+    for name, column in memory._columns.items():
+        assert np.array_equal(
+            stored._columns[name], column, equal_nan=True
+        ), name
+
+
+def test_trees(pair, roots):
+    memory, stored = pair
+    assert list(stored.sub_groups_r.items()) == list(
+        memory.sub_groups_r.items()
+    )
+    for group in roots[:20]:
+        if group in memory.sub_groups_r:
+            trees = [Tree(group, treetables=t) for t in pair]
+            assert list(trees[1].nodes) == list(trees[0].nodes)
+
+
+def test_queries(pair, roots):
+    memory, stored = pair
+    keys = [memory.sub_groups_r[g] for g in roots if g in memory.sub_groups_r]
+    nodes = list(memory.sub_masstypes)[::7]
+    for name in ("final_descendant", "merge_snapshot", "depth"):
+        assert np.array_equal(
+            getattr(stored, name)(nodes), getattr(memory, name)(nodes)
+        ), name
+    for name in ("subtree_size", "subtree_mass"):
+        assert np.allclose(
+            _plain(getattr(stored, name)(keys)),
+            _plain(getattr(memory, name)(keys)),
+        ), name
+    assert np.array_equal(
+        _plain(stored.history(keys, "masstypes")),
+        _plain(memory.history(keys, "masstypes")),
+        equal_nan=True,
+    )
+    for query in (lambda t: t.formation(keys), lambda t: t.mergers()):
+        expected = query(memory)
+        for name, values in query(stored).items():
+            assert np.array_equal(
+                _plain(values), _plain(expected[name]), equal_nan=True
+            ), name
+
+
+def test_reopen(configfile, store):
+    # columns and derived indices built before are opened, not rebuilt
+    for i in range(2):
+        treetables = TreeTables(63, configfile, store=store)
+        assert i == 0 or treetables.timings == []
+        keys = list(treetables.sub_groups_r.values())
+        Tree(next(iter(treetables.sub_groups_r)), treetables=treetables)
+        treetables.merge_snapshot(keys)
+    stages = {timing["stage"] for timing in treetables.timings}
+    assert "reverse index" not in stages
+    assert "index progenitors" not in stages
+
+
+def test_other_forest(write_config, store):
+    configfile = write_config(ntrees=3, seed=9)
+    with pytest.raises(ValueError, match="other tree files"):
+        TreeTables(63, configfile, instrument=False, store=store)
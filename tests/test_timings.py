@@ -0,0 +1,21 @@
+from simtrees import Tree, TreeTables
+
+
+def test_grow_trees_tallied(configfile):
+    treetables = TreeTables(63, configfile, profile_memory=True)
+    groups = [group for group in treetables.sub_groups_r if group[0] == 63]
+    Tree(groups[0], treetables=treetables)
+    ntimings = len(treetables.timings)
+    nstages = len(treetables.memory_report()["stages"])
+    trees = [Tree(group, treetables=treetables) for group in groups]
+    assert len(treetables.timings) == ntimings
+    assert len(treetables.memory_report()["stages"]) == nstages
+    (entry,) = [
+        entry
+        for entry in treetables.timings
+        if entry["stage"] == "grow trees"
+    ]
+    assert entry["count"] == len(groups) + 1
+    assert entry["rows"] == len(trees[0].nodes) + sum(
+        len(tree.nodes) for tree in trees
+    )